@@ -1,14 +1,63 @@
-import torch 
 import random 
 import numpy as np 
-from game import SnakeGameAI, Direction, Point
-from collections import deque # double-ended queue - data structure for storing the memories
+from game import SnakeGameAI, encode_states, RAY_FEATURES
+from memory import ReplayMemory, PrioritizedReplayMemory, CompactReplayMemory # preallocated numpy ring buffers for storing the memories
+from metrics import Metrics
+from spectator import Spectator
+from trajectory import TrajectoryRecorder
+# torch (model, trainer and checkpoints) is imported where it is used:
+# an Agent(engine=...) only plays, and never loads it
 
-# CONSTANT PARAMS:
+# DEFAULT PARAMS (Agent and train() take other values, e.g. from sweep.py):
 
 MAX_MEMORY = 100_000
 BATCH_SIZE = 1000
 LR = 0.001 # LEARNING RATE
+GAMMA = 0.9 # the DISCOUNT RATE (must be < 1)
+# epsilon = EPSILON_START - EPSILON_DECAY * n_games, a random move when randint(0,200) < epsilon
+EPSILON_START = 80
+EPSILON_DECAY = 1
+
+# calculate the state of a game: the 11 features (+ the 24 ray features with rays=True),
+# Agent.get_state, also used by the actors of parallel.py that have no Agent
+def game_state(game, rays=False):
+    # 11 states recall.
+    # read straight from the cell grid of the game (cells, direction codes: no Points)
+    head = game.head_cell
+    d = game.dir # index into CLOCK_WISE: 0 right, 1 down, 2 left, 3 up
+    steps = game.steps
+
+    # a won game (full board) has no food left, then all food flags are 0
+    food = game.food_cell if game.food_cell >= 0 else head
+    head_x, head_y = game.cell_xy(head)
+    food_x, food_y = game.cell_xy(food)
+
+    # the 11 states:
+    state = [
+        # Danger straight, right, left: wall or body on the next cell in that direction
+        game.blocked(head + steps[d]),
+        game.blocked(head + steps[(d + 1) % 4]),
+        game.blocked(head + steps[(d - 1) % 4]),
+
+        # Move direction
+
+        d == 2, # left
+        d == 0, # right
+        d == 3, # up
+        d == 1, # down
+
+        # Food location
+        food_x < head_x, # food left
+        food_x > head_x, # food right
+        food_y < head_y, # food up
+        food_y > head_y # food down
+    ]
+
+    state = np.array(state, dtype=int)
+    if rays:
+        return np.concatenate((state, game.rays()))
+    return state
+
 
 class Agent:
 
@@ -26,110 +75,186 @@ class Agent:
     '''
     # we need to store the game and the model in this class
 
-    def __init__(self):
+    # prioritized=True samples the replay memory by TD error (sum-tree) instead of uniformly,
+    # compact=True stores the transitions bit-packed (~6 bytes each, uniform sampling only)
+    # training schedule (see learn()):
+    # * online=True: 1 gradient step on every single transition (train_short_memory)
+    # * train_every=K: mini-batch updates from the replay memory every K steps, 0 = once per game
+    # * replay_ratio: transitions trained per environment step, None = 1 mini-batch every K steps
+    # * warmup: no training until the memory holds this many transitions
+    # the default is the original schedule: online + 1 mini-batch per game
+    # memory_path: keep the replay memory in memory-mapped files in that directory (for checkpoints)
+    # rays=True: the state gets the 24 ray features of the game after the 11 (the game needs rays=True too)
+    # hyperparameters: lr, gamma, batch_size, max_memory and the epsilon schedule (epsilon_start, epsilon_decay)
+    # engine: a NumpyQNet (inference.py) to play with, e.g. Agent(engine=NumpyQNet.load('model/model.npz')):
+    # no torch model and no trainer, so torch is not imported (the agent can't train then)
+    def __init__(self, prioritized=False, online=True, train_every=0, replay_ratio=None, warmup=0, memory_path=None,
+                 compact=False, rays=False, lr=LR, gamma=GAMMA, batch_size=BATCH_SIZE, max_memory=MAX_MEMORY,
+                 epsilon_start=EPSILON_START, epsilon_decay=EPSILON_DECAY, engine=None):
         # store params:
         self.n_games = 0 # keep track of the games played
+        self.n_steps = 0 # and the steps
+        self.n_updates = 0 # and the gradient steps
         self.epsilon = 0 # param to control the randomness 
-        self.gamma = 0 # the DISCOUNT RATE
-        self.memory = deque(maxlen=MAX_MEMORY) # store memories up to 100,000; 
-        # if the limit is exceeded remove elements from the left of the deque, calling popleft()
-        # TODO: model, trainer
-        self.model = None # TODO
-        self.trainer = None # TODO 
+        self.gamma = gamma # the DISCOUNT RATE (must be < 1)
+        self.lr = lr
+        self.batch_size = batch_size
+        self.epsilon_start = epsilon_start
+        self.epsilon_decay = epsilon_decay
+        self.prioritized = prioritized
+        self.online = online
+        self.train_every = train_every
+        self.replay_ratio = replay_ratio
+        self.warmup = warmup
+        self._replay_credit = 0 # transitions we still have to train on (replay_ratio)
+        self.rays = rays
+        self.state_size = 11 + (RAY_FEATURES if rays else 0)
+        if self.prioritized:
+            self.memory = PrioritizedReplayMemory(max_memory, self.state_size, path=memory_path)
+        elif compact:
+            if rays:
+                raise ValueError('the compact memory only stores the 11 binary states, not the ray features')
+            self.memory = CompactReplayMemory(max_memory, path=memory_path)
+        else:
+            self.memory = ReplayMemory(max_memory, self.state_size, path=memory_path) # store memories up to max_memory (100,000); 
+        # if the limit is exceeded the oldest memories are overwritten
+        self.rng = np.random.default_rng() # for batched exploration
+        # engine: plays instead of the torch model; set it on a trained agent too
+        # (agent.engine = NumpyQNet.from_model(agent.model)), it is a copy: training doesn't change it
+        self.engine = engine
+        if engine is not None:
+            if engine.input_size != self.state_size:
+                raise ValueError('the engine takes %d inputs, the state has %d' % (engine.input_size, self.state_size))
+            self.model = None
+            self.trainer = None
+        else:
+            import torch
+            from model import Linear_QNet, QTrainer
+            self.model = Linear_QNet(self.state_size, 256, 3) # 11 (+ 24 ray) states in, 3 actions out
+            self.trainer = QTrainer(self.model, lr=lr, gamma=self.gamma)
+            # inference: preallocated input buffer (grown when a bigger batch comes)
+            self._inputs = torch.empty((1, self.state_size))
+        self.metrics = Metrics(sinks=[]) # phase timers, off unless train() gets metrics with timing=True
 
     # calculate the state
     def get_state(self, game):
-        # 11 states recall.
-        head = game.snake[0]
-        point_l = Point(head.x - 20, head.y)
-        point_r = Point(head.x + 20, head.y)
-        point_u = Point(head.x, head.y - 20)
-        point_d = Point(head.x, head.y + 20)
-
-        dir_l =  game.direction == Direction.LEFT
-        dir_r = game.direction == Direction.RIGHT
-        dir_u = game.direction == Direction.UP
-        dir_d = game.direction == Direction.DOWN
-        
-        # the 11 states:
-        state = [
-            # Danger straight
-            (dir_r and game.is_collision(point_r)) or 
-            (dir_l and game.is_collision(point_l)) or 
-            (dir_u and game.is_collision(point_u)) or 
-            (dir_d and game.is_collision(point_d)),
-
-            # Danger right
-            (dir_u and game.is_collision(point_r)) or 
-            (dir_l and game.is_collision(point_u)) or 
-            (dir_r and game.is_collision(point_d)) or 
-            (dir_d and game.is_collision(point_l)),
-
-            # Danger left
-            (dir_r and game.is_collision(point_u)) or 
-            (dir_l and game.is_collision(point_d)) or 
-            (dir_u and game.is_collision(point_l)) or 
-            (dir_d and game.is_collision(point_r)), 
-
-            # Move direction
-
-            dir_l,
-            dir_r,
-            dir_u,
-            dir_d,
-
-            # Food location
-            game.food.x < game.head.x, # food left
-            game.food.x > game.head.x, # food right
-            game.food.y < game.head.y, # food up
-            game.food.y > game.head.y # food down
-        ]
-
-        return np.array(state, dtype=int)
+        return game_state(game, self.rays)
+
+    # calculate the states of many games at once (VectorSnakeEnv, or a single SnakeGameAI -> shape (1, 11))
+    def get_states(self, game):
+        if self.rays:
+            raise ValueError('the ray features are only computed for single games (get_state)')
+        if isinstance(game, SnakeGameAI):
+            heads = np.array([game.cell_xy(game.head_cell)])
+            foods = np.array([game.cell_xy(game.food_cell) if game.food_cell >= 0 else (-1, -1)])
+            directions = np.array([game.dir])
+            return encode_states(heads, directions, foods, game.occupancy[None])
+        return encode_states(game.heads, game.directions, game.foods, game.occupancy)
 
     # remembers 
     def remember(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done)) # the deque has an append method 
-        # popleft() if MAX_MEMORY is reached
+        self.memory.append(state, action, reward, next_state, done) # O(1), overwrites the oldest memory if max_memory is reached
 
         
     # 2 different train functions:
     def train_long_memory(self):
         # get variables from the memory (a batch of them, e.g. 1000 samples from memory)
-        # first check if we have 1000 samples in memory:
-        if self.memory > BATCH_SIZE: # have random sample if true
-            mini_sample = random.sample(self.memory, BATCH_SIZE) 
-            # returns a list of tuples
-        else:
-            # if we don't have 1000 samples yet, then take all of the memories:
-            mini_sample = self.memory 
-
-        states, actions, rewards, next_states, dones = zip(*mini_sample) # puts every state, actions, etc together
-        self.trainer.train_step(states, actions, rewards, next_states, dones)
+        # random sample of 1000 memories, if we don't have 1000 samples yet, then take all of the memories
+        # returns one numpy array per field (actions as indices 0, 1, 2)
+        self.n_updates += 1
+        with self.metrics.phase('train_long_memory'):
+            if self.prioritized:
+                # sampled by priority, the importance-sampling weights correct the loss for that,
+                # the new TD errors become the new priorities
+                states, actions, rewards, next_states, dones, weights, idx = self.memory.sample(self.batch_size)
+                td_errors = self.trainer.train_step(states, actions, rewards, next_states, dones, weights)
+                self.memory.update_priorities(idx, td_errors)
+            else:
+                states, actions, rewards, next_states, dones = self.memory.sample(self.batch_size)
+                self.trainer.train_step(states, actions, rewards, next_states, dones)
 
     # with only 1 step:
     def train_short_memory(self, state, action, reward, next_state, done):
         # optimization:
-        self.trainer.train_step(state, action, reward, next_state, done) # train for 1 game step 
-
-
+        self.n_updates += 1
+        with self.metrics.phase('train_short_memory'):
+            self.trainer.train_step(state, action, reward, next_state, done) # train for 1 game step 
+
+    # remember the transition and train according to the schedule, called after every step
+    def learn(self, state, action, reward, next_state, done):
+        self.n_steps += 1
+        with self.metrics.phase('remember'):
+            self.remember(state, action, reward, next_state, done)
+        if len(self.memory) < self.warmup:
+            return
+
+        if self.online:
+            self.train_short_memory(state, action, reward, next_state, done)
+
+        if self.train_every == 0:
+            # once per game: train the long memory when the game is over
+            if done:
+                self.train_long_memory()
+        elif self.n_steps % self.train_every == 0:
+            if self.replay_ratio is None:
+                self.train_long_memory()
+            else:
+                self.train_replay(self.train_every)
+
+    # as many mini-batches as needed to train replay_ratio transitions per new transition,
+    # for n new transitions (the rest is carried over), returns the number of mini-batches
+    def train_replay(self, n):
+        self._replay_credit += self.replay_ratio * n
+        updates = 0
+        while self._replay_credit >= self.batch_size:
+            self.train_long_memory()
+            self._replay_credit -= self.batch_size
+            updates += 1
+        return updates
+
+
+    # the move as an integer: 0 straight, 1 right, 2 left (play_step, remember and the trainer all take it as is)
     def get_action(self, state):
         # do random moves in the beginning: tradeoff betweent exploration(random moves to explore the environtment) and exploitation(less randomness, exploit the agent model) 
-        self.epsilon = 80 - self.n_games # depends on the number of games, hardcoded here
-        final_move = [0,0,0]
+        self.epsilon = self.epsilon_start - self.epsilon_decay * self.n_games # depends on the number of games
         if random.randint(0,200) < self.epsilon:
-            move = random.randint(0, 2) # gives a random value 0, 1 , or 2
-            final_move[move] = 1 
+            final_move = random.randint(0, 2) # gives a random value 0, 1 , or 2
             # the smaller the epsilon gets, the less random moves we have !!!
         else:
-            state0 = torch.tensor(state, dtype = torch.float)
-            # can be a raw value, take argmax of the tensor
-            prediction = self.model.predict(state0) # predict the action based on 1 state
-            move = torch.argmax(prediction).item() # now a single integer
-            final_move[move] = 1
+            # predict the action based on 1 state (a batch of 1)
+            if self.engine is not None:
+                final_move = self.engine.action(state)
+            else:
+                final_move = int(self.predict_actions(np.asarray(state)[None])[0])
 
         return final_move
 
+    # the greedy actions (argmax of the Q values) for a batch of states (n, 11) -> (n,) action indices
+    def predict_actions(self, states):
+        if self.engine is not None:
+            return self.engine.predict_actions(states)
+        import torch
+        n = len(states)
+        if n > len(self._inputs):
+            self._inputs = torch.empty((n, self._inputs.shape[1]))
+        inputs = self._inputs[:n]
+        inputs.copy_(torch.from_numpy(states)) # converts to float while copying, no new tensor
+        with torch.inference_mode(): # no autograd tracking
+            prediction = self.model.predict(inputs)
+            return prediction.argmax(dim=1).numpy()
+
+    # get_action for a batch of states (e.g. all games of a VectorSnakeEnv) -> (n,) action indices 0, 1, 2
+    # with the same epsilon schedule, but the random moves are drawn for all states at once
+    def get_actions(self, states):
+        states = np.asarray(states)
+        self.epsilon = self.epsilon_start - self.epsilon_decay * self.n_games
+        explore = self.rng.integers(0, 201, len(states)) < self.epsilon # like random.randint(0,200) < epsilon
+        moves = np.empty(len(states), dtype=np.int64)
+        moves[explore] = self.rng.integers(0, 3, int(explore.sum()))
+        if not explore.all():
+            moves[~explore] = self.predict_actions(states[~explore])
+        return moves
+
 # global function train:
 
 '''        
@@ -142,49 +267,103 @@ class Agent:
     * remember 
     * model.train()
 '''
-def train():
+# headless=True trains without a window and without the SPEED limit,
+# render_every=N still shows every N-th game, prioritized=True uses prioritized experience replay,
+# compact=True the bit-packed replay memory,
+# online, train_every, replay_ratio and warmup set the training schedule (see Agent),
+# checkpoint_dir: save the run there on every new record and every checkpoint_every games, and resume from it,
+# max_games: stop after that many games and return the agent (None = run forever),
+# metrics: a metrics.Metrics (sinks, phase timing), default = print every game like before,
+# spectate=True: watch the game in a separate window (Spectator, spectate_fps frames per second)
+# while training runs headless at full speed,
+# seed: seeds the games (not the agent), record_file: append every game (seed, actions, rewards) to this trajectory file,
+# cols, rows: board size in cells (default 32x24), rays=True: add the ray features to the state,
+# early_stop: called with the score of every finished game, stops the run when it returns True (see sweep.py),
+# hyperparams: lr, gamma, batch_size, max_memory, epsilon_start, epsilon_decay for the Agent
+def train(headless=False, render_every=0, prioritized=False, online=True, train_every=0, replay_ratio=None, warmup=0,
+          checkpoint_dir=None, checkpoint_every=100, max_games=None, metrics=None, compact=False,
+          spectate=False, spectate_fps=30, seed=None, record_file=None, cols=None, rows=None, rays=False,
+          early_stop=None, **hyperparams):
     plot_scores = [] # list to keep track of the scores and plotting later
     plot_mean_scores = [] # tracking the average scores
     total_score = 0 # total score, starts with 0
     record = 0 # best score, starts with 0 
-    agent = Agent() # the agent
-    game = SnakeGameAI() # the game 
-
-    while True: # runs forever until script is closed
+    checkpointer = None
+    if checkpoint_dir is not None:
+        from checkpoint import Checkpointer
+        checkpointer = Checkpointer(checkpoint_dir)
+    agent = Agent(prioritized=prioritized, online=online, train_every=train_every,
+                  replay_ratio=replay_ratio, warmup=warmup, compact=compact, rays=rays,
+                  memory_path=checkpointer.memory_path if checkpointer is not None else None,
+                  **hyperparams) # the agent
+    game = SnakeGameAI(headless=headless or spectate, render_every=render_every, seed=seed,
+                       cols=cols, rows=rows, rays=rays) # the game 
+    if checkpointer is not None and checkpointer.exists():
+        record = checkpointer.load(agent, game) # resume the run (and the seeds of the games)
+    if metrics is None:
+        metrics = Metrics()
+    agent.metrics = metrics
+    recorder = TrajectoryRecorder(record_file, game.w, game.h, rewards=True) if record_file is not None else None
+    spectator = Spectator(game.w, game.h, spectate_fps) if spectate else None
+
+    while max_games is None or agent.n_games < max_games: # runs forever until script is closed
         # get old/current state
-        state_old = agent.get_state(game) 
+        with metrics.phase('get_state'):
+            state_old = agent.get_state(game) 
 
         # get move based on the current state:
-        final_move = agent.get_action(state_old)
+        with metrics.phase('get_action'):
+            final_move = agent.get_action(state_old)
 
         # perform the move and get new state:
-        reward, done, score = game.play_step(final_move)
+        with metrics.phase('play_step'):
+            reward, done, score = game.play_step(final_move)
+        if recorder is not None:
+            recorder.step(final_move, reward)
 
         # get the new state:
-        state_new = agent.get_state(game)
+        with metrics.phase('get_state'):
+            state_new = agent.get_state(game)
 
-        # train the short memory of the agent (for only 1 step)
-        agent.train_short_memory(state_old, final_move, reward, state_new, done)
-
-        # remember:
-        agent.remember(state_old, final_move, reward, state_new, done)
+        # remember and train: by default the short memory of the agent (for only 1 step) and,
+        # when the game is over, the long memory = replay memory/experience replay - trains on ALL THE PREVIOUS GAMES!
+        agent.learn(state_old, final_move, reward, state_new, done)
 
         if done:
-            # train the long memory = replay memory/experience replay - trains on ALL THE PREVIOUS GAMES!
+            if recorder is not None:
+                recorder.end_episode(game.seed, score)
             # plot the results too
             # 1st reset the game:
             game.reset()
             # increase the number of games the agent has played:
             agent.n_games += 1
-            agent.train_long_memory()
 
             if score > record:
                 record = score 
-                # TODO: agent.model.save()
+                agent.model.save()
+                if checkpointer is not None:
+                    checkpointer.save(agent, record, game=game) # in the background
+            elif checkpointer is not None and agent.n_games % checkpoint_every == 0:
+                checkpointer.save(agent, record, game=game)
 
-            print('Game: ', agent.n_games, ' Score: ', score, ' Record: ', record)
+            metrics.log_game(agent.n_games, score, record, agent.n_steps, agent.n_updates)
+            if early_stop is not None and early_stop(score):
+                break
 
             # TODO: plot 
 
-if __name__ == 'main':
+        if spectator is not None:
+            spectator.publish(game)
+
+    if checkpointer is not None:
+        # the final state: resuming from an older checkpoint would find the memory files ahead of it
+        checkpointer.save(agent, record, block=True, game=game)
+    if spectator is not None:
+        spectator.close()
+    if recorder is not None:
+        recorder.close()
+    metrics.close()
+    return agent
+
+if __name__ == '__main__':
     train()
\ No newline at end of file
@@ -0,0 +1,256 @@
+import os
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+import torch
+from game import SnakeGameAI, VectorSnakeEnv, Point, BLOCK_SIZE, CLOCK_WISE, DX, DY
+from agent import Agent, train
+from memory import ReplayMemory, PrioritizedReplayMemory, CompactReplayMemory
+from model import Linear_QNet, QTrainer
+
+# the rendered benchmarks draw into an offscreen display when there is no screen
+if sys.platform.startswith('linux') and not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY'):
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+'''
+Benchmark suite: environment, state encoder, replay memory, inference, trainer and the whole train() loop.
+
+    python benchmark.py                 # full run, JSON on stdout
+    python benchmark.py --quick         # smaller sizes, for a fast check
+    python benchmark.py --out run.json  # write the JSON to a file
+
+Every result is one record {"name": ..., parameters ..., metrics ...}, so two runs can be compared
+record by record to catch regressions.
+'''
+
+# board sizes in pixels (cols x rows = w/BLOCK_SIZE x h/BLOCK_SIZE) and snake lengths to measure
+BOARDS = [(200, 200), (640, 480), (1600, 1600)]
+LENGTHS = [3, 50, 300]
+
+
+def _time_per_call(fn, n, repeat=3):
+    # best of repeat runs, seconds per call
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        for _ in range(n):
+            fn()
+        best = min(best, (time.perf_counter() - t) / n)
+    return best
+
+
+def _cycle(cols, rows):
+    # a Hamiltonian cycle over the board (rows must be even): right along row 0,
+    # zig-zag through columns 1.. on the other rows, back up on column 0
+    cells = [(x, 0) for x in range(cols)]
+    for y in range(1, rows):
+        xs = range(cols - 1, 0, -1) if y % 2 == 1 else range(1, cols)
+        cells += [(x, y) for x in xs]
+    cells += [(0, y) for y in range(rows - 1, 0, -1)]
+    return cells
+
+
+class _CycleDriver:
+
+    '''
+    Keeps a game with a snake of the given length running without dying:
+    the snake follows a Hamiltonian cycle, after a timeout the snake is laid out again.
+    '''
+
+    def __init__(self, game, length):
+        self.game = game
+        self.length = length
+        self.cycle = _cycle(game.cols, game.rows)
+        n = len(self.cycle)
+        # the direction (index into CLOCK_WISE) to take on every cell to stay on the cycle
+        steps = list(zip(DX.tolist(), DY.tolist()))
+        self.next_dir = {}
+        for i, (x, y) in enumerate(self.cycle):
+            nx, ny = self.cycle[(i + 1) % n]
+            self.next_dir[(x, y)] = steps.index((nx - x, ny - y))
+        self.actions = {0: 0, 1: 1, 3: 2} # turn -> action 0 straight, 1 right, 2 left
+        self.layout()
+
+    def layout(self):
+        # snake on the first `length` cells of the cycle, head last
+        cells = self.cycle[self.length - 1::-1]
+        x, y = cells[0]
+        px, py = cells[1]
+        direction = CLOCK_WISE[list(zip(DX.tolist(), DY.tolist())).index((x - px, y - py))]
+        self.game.set_snake([Point(cx * BLOCK_SIZE, cy * BLOCK_SIZE) for cx, cy in cells], direction)
+
+    def action(self):
+        game = self.game
+        turn = (self.next_dir[game.cell_xy(game.head_cell)] - game.dir) % 4
+        return self.actions[turn]
+
+    def step(self):
+        reward, done, score = self.game.play_step(self.action())
+        if done:
+            self.layout()
+
+
+def _boards_and_lengths(boards, lengths):
+    for w, h in boards:
+        cols, rows = w // BLOCK_SIZE, h // BLOCK_SIZE
+        for length in lengths:
+            if length < cols * rows // 2:
+                yield w, h, length
+
+
+def bench_play_step(boards, lengths, n):
+    results = []
+    for w, h, length in _boards_and_lengths(boards, lengths):
+        game = SnakeGameAI(w, h, headless=True)
+        driver = _CycleDriver(game, length)
+        action = driver.action
+        sec = _time_per_call(driver.step, n) - _time_per_call(action, n) # without the driver's own cost
+        board = '%dx%d' % (game.cols, game.rows)
+        results.append({'name': 'play_step', 'mode': 'headless', 'board': board, 'length': length,
+                        'steps_per_sec': 1 / sec})
+
+        # rendered: the same step + drawing the frame (without the SPEED limit of the clock)
+        game._init_display()
+        def rendered():
+            driver.step()
+            game._update_ui()
+        sec = _time_per_call(rendered, max(n // 20, 10))
+        results.append({'name': 'play_step', 'mode': 'rendered', 'board': board, 'length': length,
+                        'steps_per_sec': 1 / sec})
+    return results
+
+
+def bench_get_state(boards, lengths, n):
+    results = []
+    agent = Agent()
+    for w, h, length in _boards_and_lengths(boards, lengths):
+        game = SnakeGameAI(w, h, headless=True)
+        _CycleDriver(game, length)
+        sec = _time_per_call(lambda: agent.get_state(game), n)
+        results.append({'name': 'get_state', 'board': '%dx%d' % (game.cols, game.rows), 'length': length,
+                        'latency_us': sec * 1e6})
+    return results
+
+
+def bench_vector_env(n_envs_list, n):
+    results = []
+    agent = Agent()
+    for n_envs in n_envs_list:
+        env = VectorSnakeEnv(n_envs, seed=0)
+        actions = np.random.default_rng(0).integers(0, 3, (n, n_envs))
+        i = iter(range(10 ** 9))
+        sec = _time_per_call(lambda: env.step(actions[next(i) % n]), n)
+        results.append({'name': 'vector_env_step', 'n_envs': n_envs, 'steps_per_sec': n_envs / sec})
+        sec = _time_per_call(lambda: agent.get_states(env), n)
+        results.append({'name': 'get_states', 'n_envs': n_envs, 'states_per_sec': n_envs / sec})
+    return results
+
+
+def bench_replay(capacities, batch_size=1000):
+    results = []
+    state = np.zeros(11, dtype=int)
+    for memory_class in (ReplayMemory, PrioritizedReplayMemory, CompactReplayMemory):
+        for capacity in capacities:
+            memory = memory_class(capacity, seed=0)
+            n = min(capacity, 100_000)
+            # Agent.remember path: one transition at a time
+            t = time.perf_counter()
+            for _ in range(n):
+                memory.append(state, [0, 1, 0], 0, state, False)
+            append_sec = (time.perf_counter() - t) / n
+            # fill the rest in batches
+            while len(memory) < capacity:
+                k = min(100_000, capacity - len(memory))
+                memory.extend(np.zeros((k, 11)), np.zeros(k, dtype=int), np.zeros(k), np.zeros((k, 11)), np.zeros(k, dtype=bool))
+            sample_sec = _time_per_call(lambda: memory.sample(batch_size), 50)
+            results.append({'name': 'replay', 'memory': memory_class.__name__, 'size': capacity,
+                            'remember_per_sec': 1 / append_sec,
+                            'sample_batches_per_sec': 1 / sample_sec,
+                            'sample_transitions_per_sec': batch_size / sample_sec,
+                            'nbytes': memory.nbytes})
+    return results
+
+
+def bench_get_action(batch_sizes, n):
+    results = []
+    agent = Agent()
+    agent.n_games = 10 ** 6 # no random moves, always the model
+    state = np.zeros(11, dtype=int)
+    sec = _time_per_call(lambda: agent.get_action(state), n)
+    results.append({'name': 'get_action', 'batch': 1, 'latency_us': sec * 1e6})
+    for batch in batch_sizes:
+        states = np.random.default_rng(0).integers(0, 2, (batch, 11))
+        sec = _time_per_call(lambda: agent.get_actions(states), max(n // 10, 10))
+        results.append({'name': 'get_actions', 'batch': batch, 'latency_us': sec * 1e6,
+                        'states_per_sec': batch / sec})
+    return results
+
+
+def bench_train_step(batch_sizes, n):
+    results = []
+    trainer = QTrainer(Linear_QNet(11, 256, 3), lr=0.001, gamma=0.9)
+    rng = np.random.default_rng(0)
+    for batch in batch_sizes:
+        states = rng.integers(0, 2, (batch, 11)).astype(np.float32)
+        actions = rng.integers(0, 3, batch)
+        rewards = rng.choice([-10.0, 0.0, 10.0], batch).astype(np.float32)
+        dones = rng.random(batch) < 0.05
+        sec = _time_per_call(lambda: trainer.train_step(states, actions, rewards, states, dones), max(n // batch, 5))
+        results.append({'name': 'train_step', 'batch': batch, 'steps_per_sec': 1 / sec,
+                        'samples_per_sec': batch / sec})
+    return results
+
+
+def bench_train(n_games):
+    # in a temporary directory (train() saves the model on every record), without the prints of every game
+    with tempfile.TemporaryDirectory() as tmp, contextlib.chdir(tmp), contextlib.redirect_stdout(io.StringIO()):
+        t = time.perf_counter()
+        agent = train(headless=True, max_games=n_games)
+        sec = time.perf_counter() - t
+    return [{'name': 'train', 'games': n_games, 'env_steps': agent.n_steps, 'env_steps_per_sec': agent.n_steps / sec}]
+
+
+def run(quick=False):
+    n = 500 if quick else 5000
+    results = []
+    results += bench_play_step(BOARDS[:2] if quick else BOARDS, LENGTHS, n)
+    results += bench_get_state(BOARDS[:2] if quick else BOARDS, LENGTHS, n)
+    results += bench_vector_env([64, 1024] if quick else [64, 1024, 8192], 50 if quick else 200)
+    results += bench_replay([10_000] if quick else [10_000, 100_000, 1_000_000])
+    results += bench_get_action([64, 1024] if quick else [64, 1024, 8192], n)
+    results += bench_train_step([1, 32, 1000] if quick else [1, 32, 256, 1000, 4096], 20 * n)
+    results += bench_train(5 if quick else 50)
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'torch': torch.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'torch_threads': torch.get_num_threads(),
+            'quick': quick,
+        },
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Snake RL benchmarks, results as JSON')
+    parser.add_argument('--quick', action='store_true', help='smaller sizes, for a fast check')
+    parser.add_argument('--out', help='write the JSON to this file instead of stdout')
+    args = parser.parse_args()
+
+    report = run(quick=args.quick)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
@@ -0,0 +1,97 @@
+import os
+import copy
+import random
+import threading
+import torch
+
+'''
+Resumable checkpoints of a training run:
+model, optimizer, game/step counters (= position of the epsilon schedule), rng states and the replay memory,
+with the game: its seed generator, so the resumed run plays the same games as one that never stopped.
+
+The replay memory is never copied: the agent keeps it in memory-mapped files inside the
+checkpoint directory (Agent(memory_path=checkpointer.memory_path)), a save only flushes them
+and stores the memory counters. Everything else is small, it is snapshotted in the training
+thread and written to disk by a background thread, so the training loop doesn't wait for the disk.
+'''
+
+
+class Checkpointer:
+
+    def __init__(self, directory='checkpoint'):
+        self.directory = directory
+        self.file_name = os.path.join(directory, 'checkpoint.pth')
+        self.memory_path = os.path.join(directory, 'memory')
+        self._thread = None
+
+    def exists(self):
+        return os.path.exists(self.file_name)
+
+    # game: the SnakeGameAI being trained on, saved right after its reset (the seed of the game about to start)
+    def save(self, agent, record, block=False, game=None):
+        # snapshot now (copies, training goes on while they are written) ...
+        state = {
+            'model': {k: v.clone() for k, v in agent.model.state_dict().items()},
+            'optimizer': copy.deepcopy(agent.trainer.optimizer.state_dict()),
+            'n_games': agent.n_games,
+            'n_steps': agent.n_steps,
+            'n_updates': agent.n_updates,
+            'epsilon': agent.epsilon,
+            'replay_credit': agent._replay_credit,
+            'record': record,
+            'memory': agent.memory.state_dict(),
+            'memory_type': type(agent.memory).__name__,
+            'rng': {
+                'python': random.getstate(),
+                'numpy': agent.rng.bit_generator.state,
+                'torch': torch.get_rng_state(),
+            },
+        }
+        if game is not None:
+            state['game'] = {'seeds': game._seeds.getstate(), 'seed': game.seed}
+        # ... and write in the background, one save at a time
+        self.wait()
+        self._thread = threading.Thread(target=self._write, args=(state, agent.memory))
+        self._thread.start()
+        if block:
+            self.wait()
+
+    def _write(self, state, memory):
+        memory.flush()
+        os.makedirs(self.directory, exist_ok=True)
+        # write to a temporary file first, a crash during the save keeps the previous checkpoint
+        tmp_file_name = self.file_name + '.tmp'
+        torch.save(state, tmp_file_name)
+        os.replace(tmp_file_name, self.file_name)
+
+    def wait(self):
+        # block until the running save (if any) is on disk
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def load(self, agent, game=None):
+        # resume the agent (and the game) from the last checkpoint, returns the record score
+        state = torch.load(self.file_name, weights_only=False)
+        # the arrays of the memory are checked when they are opened, the memory type here
+        # (a prioritized memory has the same arrays as a plain one + the priorities)
+        memory_type = state.get('memory_type', type(agent.memory).__name__)
+        if memory_type != type(agent.memory).__name__:
+            raise ValueError('%s was saved with a %s, the agent has a %s'
+                             % (self.file_name, memory_type, type(agent.memory).__name__))
+        agent.model.load_state_dict(state['model'])
+        agent.trainer.optimizer.load_state_dict(state['optimizer'])
+        agent.n_games = state['n_games']
+        agent.n_steps = state['n_steps']
+        agent.n_updates = state['n_updates']
+        agent.epsilon = state['epsilon']
+        agent._replay_credit = state['replay_credit']
+        agent.memory.load_state_dict(state['memory'])
+        random.setstate(state['rng']['python'])
+        agent.rng.bit_generator.state = state['rng']['numpy']
+        torch.set_rng_state(state['rng']['torch'])
+        if game is not None and 'game' in state:
+            # start the game that was about to be played again, the next seeds follow from the generator
+            game._seeds.setstate(state['game']['seeds'])
+            game.reset(state['game']['seed'])
+        return state['record']
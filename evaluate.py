@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from game import VectorSnakeEnv, encode_states, END_WALL, END_BODY, END_TIMEOUT, END_WON
+from inference import NumpyQNet, WEIGHTS
+from tabular import greedy_actions
+
+'''
+Greedy evaluation of a trained policy: no exploration (epsilon 0), no training, thousands of games.
+
+* the games run on a VectorSnakeEnv (n_envs at once), the states of all games are encoded in one
+  go and the actions come from one batched forward pass per step (NumpyQNet, torch isn't needed
+  unless the model is a .pth file)
+* workers > 1 splits the games over processes, each with its own env (seed + worker) and 1 BLAS thread
+* exactly n_games are counted: once that many games have started, finished slots don't start new ones
+  (taking the first n_games to finish would favour the short games)
+* the report: score distribution (mean, std, percentiles, max), episode lengths, how the games ended
+  (wall, body, timeout, won) and steps/sec
+
+    python evaluate.py                                      # model/model.pth, 10,000 games
+    python evaluate.py model/model.npz --games 100000 --workers 8
+    python evaluate.py model/tabular_policy.npy --min-mean 20   # exit status 1 below a mean score of 20
+'''
+
+PERCENTILES = [5, 25, 50, 75, 95, 99]
+# thread count variables of the BLAS libraries numpy may use, set to 1 for the worker processes
+THREAD_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']
+
+
+def load_policy(file_name):
+    # a trained policy as a function: (n, 11) states -> (n,) actions 0, 1, 2
+    # .npz: exported Linear_QNet weights, .pth: Linear_QNet weights saved by torch (imports torch),
+    # .npy: a tabular policy table
+    if file_name.endswith('.npy'):
+        table = np.load(file_name)
+        return lambda states: greedy_actions(table, states)
+    if file_name.endswith('.npz'):
+        net = NumpyQNet.load(file_name)
+    else:
+        import torch
+        state = torch.load(file_name, weights_only=True)
+        net = NumpyQNet(*(state[name].numpy() for name in WEIGHTS))
+    if net.input_size != 11:
+        raise ValueError('%s takes %d inputs, the evaluation only encodes the 11 states' % (file_name, net.input_size))
+    return net.predict_actions
+
+
+def play_games(policy, n_games, n_envs=1000, w=640, h=480, seed=0):
+    # plays n_games greedily on one VectorSnakeEnv, returns scores, lengths (steps) and ends of every game
+    n_envs = min(n_envs, n_games)
+    env = VectorSnakeEnv(n_envs, w, h, seed=seed)
+    scores = np.empty(n_games, dtype=np.int64)
+    lengths = np.empty(n_games, dtype=np.int64)
+    ends = np.empty(n_games, dtype=np.int8)
+    steps = np.zeros(n_envs, dtype=np.int64) # steps of the running game of every slot
+    active = np.ones(n_envs, dtype=bool) # the slot's game is one of the n_games
+    started = n_envs
+    finished = 0
+
+    while finished < n_games:
+        actions = np.zeros(n_envs, dtype=np.int64)
+        idx = np.flatnonzero(active)
+        states = encode_states(env.heads[idx], env.directions[idx], env.foods[idx], env.occupancy[idx])
+        actions[idx] = policy(states)
+        _, dones, final_scores = env.step(actions)
+        steps += 1
+
+        done = np.flatnonzero(dones & active)
+        k = len(done)
+        scores[finished:finished + k] = final_scores[done]
+        lengths[finished:finished + k] = steps[done]
+        ends[finished:finished + k] = env.ends[done]
+        finished += k
+        steps[dones] = 0
+        # the slots that start a game beyond n_games are done
+        new = min(k, n_games - started)
+        started += new
+        active[done[new:]] = False
+
+    return scores, lengths, ends
+
+
+def summarize(scores, lengths, ends, seconds):
+    # the report of a run as a dict
+    n = len(scores)
+    steps = int(lengths.sum())
+    report = {
+        'games': n,
+        'mean_score': float(scores.mean()),
+        'std_score': float(scores.std()),
+        'max_score': int(scores.max()),
+    }
+    for p, value in zip(PERCENTILES, np.percentile(scores, PERCENTILES)):
+        report['p%d_score' % p] = float(value)
+    report.update({
+        'mean_length': float(lengths.mean()),
+        'p50_length': float(np.median(lengths)),
+        'max_length': int(lengths.max()),
+        'wall_rate': float(np.mean(ends == END_WALL)),
+        'body_rate': float(np.mean(ends == END_BODY)),
+        'timeout_rate': float(np.mean(ends == END_TIMEOUT)),
+        'won_rate': float(np.mean(ends == END_WON)),
+        'steps': steps,
+        'seconds': seconds,
+        'steps_per_sec': steps / seconds,
+        'games_per_sec': n / seconds,
+    })
+    return report
+
+
+# one worker process: its share of the games
+def _play_worker(file_name, n_games, n_envs, w, h, seed):
+    return play_games(load_policy(file_name), n_games, n_envs, w, h, seed)
+
+
+def evaluate(file_name='model/model.pth', n_games=10_000, n_envs=1000, workers=1, w=640, h=480, seed=0):
+    # evaluates the saved policy, returns the report
+    start = time.perf_counter()
+    if workers <= 1:
+        results = [play_games(load_policy(file_name), n_games, n_envs, w, h, seed)]
+    else:
+        shares = [n_games // workers + (i < n_games % workers) for i in range(workers)]
+        ctx = mp.get_context('spawn')
+        # the workers start with 1 BLAS thread each (read when they import numpy)
+        for var in THREAD_VARS:
+            os.environ.setdefault(var, '1')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            futures = [pool.submit(_play_worker, file_name, share, n_envs, w, h, seed + i)
+                       for i, share in enumerate(shares) if share]
+            results = [future.result() for future in futures]
+    scores, lengths, ends = (np.concatenate(arrays) for arrays in zip(*results))
+    return summarize(scores, lengths, ends, time.perf_counter() - start)
+
+
+def print_report(report):
+    print('Games: ', report['games'], ' Mean score: ', round(report['mean_score'], 2),
+          ' Std: ', round(report['std_score'], 2), ' Max: ', report['max_score'])
+    print('  score percentiles: ' + '  '.join('p%d %g' % (p, report['p%d_score' % p]) for p in PERCENTILES))
+    print('  length: mean %.1f  median %g  max %d' % (report['mean_length'], report['p50_length'], report['max_length']))
+    print('  ends: wall %.1f%%  body %.1f%%  timeout %.1f%%  won %.1f%%'
+          % tuple(100 * report[k] for k in ('wall_rate', 'body_rate', 'timeout_rate', 'won_rate')))
+    print('  %.0f steps/s  %.0f games/s  %.2f s' % (report['steps_per_sec'], report['games_per_sec'], report['seconds']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Greedy evaluation of a trained policy')
+    parser.add_argument('model', nargs='?', default='model/model.pth', help='Linear_QNet weights (.pth) or tabular policy (.npy)')
+    parser.add_argument('--games', type=int, default=10_000)
+    parser.add_argument('--envs', type=int, default=1000, help='games played at once per worker')
+    parser.add_argument('--workers', type=int, default=1, help='processes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the report to this file')
+    parser.add_argument('--min-mean', type=float, help='exit with status 1 if the mean score is lower')
+    args = parser.parse_args()
+
+    report = evaluate(args.model, args.games, args.envs, args.workers, seed=args.seed)
+    print_report(report)
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.min_mean is not None and report['mean_score'] < args.min_mean:
+        sys.exit(1)
@@ -1,13 +1,21 @@
 import pygame # for the game env
 import random # for randomly placing the food
+import operator
 from enum import Enum 
-from collections import namedtuple
+from collections import namedtuple, deque
+from functools import lru_cache
 import numpy as np
 
-# 1st, initialize pygame:
-pygame.init()
+# pygame (and the font) is only initialized once a window is actually needed,
+# so headless training never touches the display:
+font = None
 
-font = pygame.font.SysFont('arial', 25) 
+def _get_font():
+    # create the font lazily, the first time we draw the score
+    global font
+    if font is None:
+        font = pygame.font.SysFont('arial', 25)
+    return font
 
 
 # 1) reset function:
@@ -39,6 +47,21 @@ Point = namedtuple('Point', 'x, y') # 'Point' being the name of the tuple; 'x',
 
 # constants:
 BLOCK_SIZE = 20
+# the inner square drawn on every snake cell (4 and 12 pixels for 20 pixel blocks)
+INNER_OFFSET = BLOCK_SIZE // 5
+INNER_SIZE = BLOCK_SIZE - 2 * INNER_OFFSET
+PAD = 2 # wall cells around the board in the cell grid of SnakeGameAI
+# channels of the grid observation (obs_grid=True), each (rows, cols) of 0/1:
+OBS_BODY = 0 # the whole snake
+OBS_HEAD = 1
+OBS_FOOD = 2
+OBS_DIRECTION = 3 # with obs_direction=True 4 more channels: channel OBS_DIRECTION + direction code has the head set
+# how a game of VectorSnakeEnv ended (VectorSnakeEnv.ends after a step):
+END_NONE = 0 # still running
+END_WALL = 1
+END_BODY = 2
+END_TIMEOUT = 3 # too long without food
+END_WON = 4 # the snake fills the board
 # the higher the number the faster your game is:
 SPEED = 10
 # RGB COLORS (0-255, 8 bit integers for light intensity)
@@ -54,70 +77,211 @@ WHITE = (255,255,255)
 class SnakeGameAI: # agent controlled game now
 
     # init function gets width, height (default 640x480 pixels)
-    def __init__(self, w=640, h=480):
-        self.w = w
-        self.h = h 
-        # init display
+    # headless=True skips the display, font and clock and runs as fast as the CPU allows,
+    # render_every=N still draws every N-th game (at SPEED) so we can watch progress, 0 = never
+    # seed: every game gets its own seed (self.seed) for the food rng, drawn from a generator seeded with this,
+    # so a run with the same seed and the same actions repeats exactly (None = different every run)
+    # obs_grid=True keeps self.obs, the board as a (channels, rows, cols) float32 array (see OBS_BODY ...),
+    # up to date after every step with a few cell writes; torch.from_numpy(game.obs) shares its memory.
+    # obs_direction=True adds the 4 direction channels
+    # cols, rows: the board size in cells instead of w, h in pixels (w = cols * BLOCK_SIZE)
+    # rays=True keeps what rays() needs: 8 ray features (wall, body and food distance) for bigger boards
+    def __init__(self, w=640, h=480, headless=False, render_every=0, seed=None, obs_grid=False, obs_direction=False,
+                 cols=None, rows=None, rays=False):
+        self.w = w if cols is None else cols * BLOCK_SIZE
+        self.h = h if rows is None else rows * BLOCK_SIZE
+        # the board in cells:
+        self.cols = self.w // BLOCK_SIZE
+        self.rows = self.h // BLOCK_SIZE
+        if self.cols < 4 or self.rows < 1:
+            raise ValueError('the board needs at least 4x1 cells for the start snake, got %dx%d' % (self.cols, self.rows))
+        # the game works on integer cells, not pixels: a cell is a flat index into the board
+        # with a border of PAD wall cells around it, (y + PAD) * stride + (x + PAD) for x, y in cells,
+        # so every cell the head can reach (1 step outside the board) and its neighbours have an index.
+        # pixels (Points) are only made for drawing and for the snake/head/food views
+        self.stride = self.cols + 2 * PAD
+        # one step in each direction (CLOCK_WISE order: right, down, left, up) = adding one of these
+        self.steps = (1, self.stride, -1, -self.stride)
+        # occupancy grid: how many snake entries are on each cell, the walls count as 1,
+        # kept up to date on every move so collision checks don't have to scan the snake.
+        # occupancy is a (rows, cols) numpy view of the board part of the same memory
+        self._occupied = bytearray((self.rows + 2 * PAD) * self.stride)
+        grid = np.frombuffer(self._occupied, dtype=np.uint8).reshape(self.rows + 2 * PAD, self.stride)
+        self.occupancy = grid[PAD:-PAD, PAD:-PAD]
+        # the empty grid (only walls) and the free-cell index of an empty board, copied on every reset
+        walls = np.ones(grid.shape, dtype=np.uint8)
+        walls[PAD:-PAD, PAD:-PAD] = 0
+        self._walls = walls.tobytes()
+        self._board_cells = np.flatnonzero(walls.reshape(-1) == 0).tolist()
+        board_pos = np.full(walls.size, -1)
+        board_pos[self._board_cells] = np.arange(len(self._board_cells))
+        self._board_pos = board_pos.tolist()
+        # grid observation: written through a flat memoryview, cell -> index on the board (-1 for walls)
+        self.obs = None
+        self.obs_direction = obs_direction
+        if obs_grid:
+            self.obs = np.zeros((obs_channels(obs_direction), self.rows, self.cols), dtype=np.float32)
+            self._obs_flat = memoryview(self.obs).cast('B').cast('f')
+            self._board_index = board_pos.tolist() # board cells are numbered row by row, like the flat board
+        # ray features: the body once more as 0/1 bytes in 4 layouts (rows, columns and both diagonals)
+        # where the cells of a line are next to each other, so the first body cell on a ray is one bytes.find
+        self._solid = None
+        if rays:
+            self._ray_tables = _ray_tables(self.cols, self.rows)
+            self._solid = [bytearray(size) for size in self._ray_tables.sizes]
+
+        self.headless = headless
+        self.render_every = render_every
+        self.n_games = 0 # number of games started, used for render_every
+        self.display = None
+        self.clock = None
+        self._drawn = None # (frame, tail cell, food cell, score, score text rect) of the last drawn frame
+        self._text = None # cached score text
+        self._text_score = None
+        self._seeds = random.Random(seed) # draws the seed of every game
+        self.rng = random.Random() # the food rng of the current game
+        if not self.headless:
+            self._init_display()
+        self.reset()
+
+    def _init_display(self):
+        # init display (only once, headless games may open it later for render_every)
+        if self.display is not None:
+            return
+        pygame.init()
         self.display = pygame.display.set_mode((self.w, self.h)) # pass as tuple the dimensions of the display
         pygame.display.set_caption('Snake') # screen caption, not necessary tho
         self.clock = pygame.time.Clock() # keeping track of time
-        self.reset()
 
-    def reset(self):
+    def reset(self, seed=None):
         # WE REFACTOR THIS INTO A RESET FUNCTION:
 
+        # seed of this game (None = the next one of the seed generator):
+        # the same seed and the same actions always give the same game
+        self.seed = self._seeds.getrandbits(32) if seed is None else seed
+        self.rng.seed(self.seed)
+
         # init game state (place food/initial snake/direction (right in this case))
         self.direction = Direction.RIGHT # could use strings like 'r' for rights, etc, but this is ERROR PRONE - TYPE CODE!
         # use ENUMERATION !
 
-        # store the position of the head:
-        # we could use a list, storing list[0] = x-coordinate; list[1] = y-coordinate (starting at w,h - middle?) 
-        # we could use a list, but that is ERROR PRONE
-        # instead, we use a NAME TUPLE - which assign a meaning to each position in a tuple
-        # allowing for a more readable and self documenting code
-        self.head = Point(self.w/2, self.h/2) # we have to store the coordinates inside of the display, starting in the middle
-
-        # creating and storing the snake itself in a list:
-        # need 3 coordinates: 
-        # head, another Point (at the same y coordinate but a bit to the left), 
-        # we don't just want to say Point.x - 1, 
-        # since the snake needs to be bigger than just 1 pixel
-        # for this, we create a constant BLOCK_SIZE
-        # and say x - 1xBLOCK_SIZE (1 block size to the left),
-        # and lastly, 
-        # 3rd coordinate is y 
-        self.snake = [self.head, Point(self.head.x - BLOCK_SIZE, self.head.y),
-                    self.head, Point(self.head.x - (2*BLOCK_SIZE), self.head.y)] # [body][head] initial snake shape
+        # store the position of the head, starting in the middle of the display:
+        self.head_cell = self._cell(Point(self.w/2, self.h/2))
+
+        # creating and storing the snake itself:
+        # the head, the cell to the left of it, the head again and the cell 2 to the left
+        # (the body is a deque of cells, head first: moving adds the new head at the front
+        # and removes the tail at the back, both O(1))
+        self.body = deque([self.head_cell, self.head_cell - 1, self.head_cell, self.head_cell - 2]) # [head][body] initial snake shape
+        self._build_grid()
 
         # for the game state,
-        # we keep track of game score 
-        self.score = 0 
+        # we keep track of game score
+        self.score = 0
+        self.won = False # True once the snake fills the whole board
         # food:
-        self.food = None
+        self.food_cell = -1 # -1 = no food
         # initially want to randomly place food
         # use a helper function
         self._place_food()
         self.frame_iteration = 0 # 0 in the beginning
-
-
-
+        if self.obs is not None:
+            self._build_obs()
+
+        # decide if this game is drawn:
+        self.render = not self.headless or (self.render_every > 0 and self.n_games % self.render_every == 0)
+        self._drawn = None # new game: draw the whole board
+        if self.render:
+            self._init_display()
+        self.n_games += 1
+
+    # the classic views of the game in pixels, made from the cells when asked for:
+    # snake - list of Points, head first (O(length)), head, food - Point (food None when there is none)
+    @property
+    def snake(self):
+        return [self._point(cell) for cell in self.body]
+
+    @property
+    def head(self):
+        return self._point(self.head_cell)
+
+    @property
+    def food(self):
+        return None if self.food_cell < 0 else self._point(self.food_cell)
+
+    @food.setter
+    def food(self, pt):
+        self.food_cell = -1 if pt is None else self._cell(pt)
+
+    # the direction as an enum, stored as its index into CLOCK_WISE (self.dir)
+    @property
+    def direction(self):
+        return CLOCK_WISE[self.dir]
+
+    @direction.setter
+    def direction(self, direction):
+        self.dir = CLOCK_WISE.index(direction)
+
+    # start from a given snake instead (list of Points, head first), e.g. a long snake for benchmarks
+    def set_snake(self, snake, direction):
+        self.body = deque(self._cell(pt) for pt in snake)
+        self.head_cell = self.body[0]
+        self.direction = direction
+        self._build_grid()
+        self._place_food()
+        self.frame_iteration = 0
+        self._drawn = None
+        if self.obs is not None:
+            self._build_obs()
+
+    # compact copy of the game for a spectator/recorder: (body, food, score),
+    # body = flat cell indices (y*cols + x) of the snake, head first, food = flat cell index (-1: none)
+    def snapshot(self):
+        cells = np.fromiter(self.body, dtype=np.int32, count=len(self.body))
+        body = (cells // self.stride - PAD) * self.cols + cells % self.stride - PAD
+        food = -1
+        if self.food_cell >= 0:
+            x, y = self.cell_xy(self.food_cell)
+            food = y * self.cols + x
+        return body, food, self.score
+
+    # show a snapshot: sets snake, food and score (the direction is not part of it)
+    def load_snapshot(self, snapshot):
+        body, food, score = snapshot
+        body = np.asarray(body)
+        self.body = deque(((body // self.cols + PAD) * self.stride + body % self.cols + PAD).tolist())
+        self.head_cell = self.body[0]
+        self.food_cell = -1 if food < 0 else (food // self.cols + PAD) * self.stride + food % self.cols + PAD
+        self.score = score
+        self._build_grid()
+        self._drawn = None
+        if self.obs is not None:
+            self._build_obs()
+
+    def _build_grid(self):
+        # occupancy grid and free-cell index for the current snake
+        self._occupied[:] = self._walls
+        # free-cell index: all empty cells in a list (any order) + the position of each cell in that list (-1 if occupied),
+        # so a cell is added/removed in O(1) (swap with the last one) and food is placed in O(1)
+        self._free_cells = list(self._board_cells)
+        self._free_pos = list(self._board_pos)
+        if self._solid is not None:
+            for solid in self._solid:
+                solid[:] = bytes(len(solid))
+        for cell in self.body:
+            self._occupy(cell)
 
     # place food helper method:
     def _place_food(self): # use a helper method to reuse later
 
-        # we want to randomly have a coordinate inside the display dimensions
-        # random xy-coordinate between values 0 to rounded number of blocks that can be placed in the display, 
-        # i.e between 0 and width, height
-        # gives us random food positions in the screen that are multiples of the block size
-        x = random.randint(0, (self.w - BLOCK_SIZE)//BLOCK_SIZE) * BLOCK_SIZE
-        y = random.randint(0, (self.h - BLOCK_SIZE) // BLOCK_SIZE) * BLOCK_SIZE
-        self.food = Point(x,y) # create a Point out of this with x,y
-        # CAREFUL!
-        # We don't want to place the food inside the snake
-        # thus, we check
-        if self.food in self.snake: # if food is in the list
-            # call the function again, recursively, creating 2 new random variables
-            self._place_food()
+        # we want a random cell of the display that is not inside the snake.
+        # instead of trying random cells until one is free (slow when the board fills up),
+        # pick a random entry of the free-cell index
+        if not self._free_cells:
+            # no empty cell left: the snake fills the board
+            self.food_cell = -1
+            return
+        self.food_cell = self._free_cells[self.rng.randrange(len(self._free_cells))]
 
 
     # play step function:
@@ -125,65 +289,241 @@ class SnakeGameAI: # agent controlled game now
         # consists of several steps:
         self.frame_iteration += 1
         # 1. collect user input (what key the user pressed)
-        for event in pygame.event.get(): 
-            # event listener from the user for events
-            # that happened inside 1 play step
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                quit() # to exit the python program
-
-        
+        # only if there is a window, headless games have no events to handle
+        if self.display is not None:
+            for event in pygame.event.get():
+                # event listener from the user for events
+                # that happened inside 1 play step
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    quit() # to exit the python program
+
+
         # 2. move the snake
         # update the head
-        self._move(action) # move the head of the snake, insert into the snake list
-        self.snake.insert(0, self.head) # insert at the beginning 
+        old_head, old_dir, old_food = self.head_cell, self.dir, self.food_cell # for the grid observation
+        self._move(action) # move the head of the snake
+        self.body.appendleft(self.head_cell) # insert at the beginning
+        self._occupy(self.head_cell)
 
         # 3. check if game over, quit if true
         # check 2 things: if we hit the boundary or the snake's tail
         reward = 0
         game_over = False
 
-        # reward: 
+        # reward:
         # eat food + 10
         # game over - 10
         # else 0
 
-        if self._is_collision() or self.frame_iteration > 100*(len(self.snake)): # or if nothing happens for too long
+        if self.is_collision() or self.frame_iteration > 100*(len(self.body)): # or if nothing happens for too long
             game_over= True
-            reward = -10 
+            reward = -10
+            if self.obs is not None:
+                self._update_obs(old_head, old_dir, old_food, -1)
             return reward, game_over, self.score
 
         # 4. place new food or just move the snake (finalize the move step)
-        if self.head == self.food:
+        if self.head_cell == self.food_cell:
             self.score+= 1
             reward = 10
             self._place_food()
+            if self.food_cell < 0:
+                # board full, game won
+                self.won = True
+                game_over = True
+                if self.obs is not None:
+                    self._update_obs(old_head, old_dir, old_food, -1)
+                return reward, game_over, self.score
+            tail = -1
             # remove the last block as we move or rather shift it:
         else:
-            self.snake.pop()
+            tail = self.body.pop()
+            self._vacate(tail)
+        if self.obs is not None:
+            self._update_obs(old_head, old_dir, old_food, tail)
 
         # 5. update the pygame ui and clock (will do this 1st to see stuff at first)
         # helper functions
-        self._update_ui()
-        self.clock.tick(SPEED) # let's us control the speed of the game - how fast the frame updates
-        # 6. return if game over and score 
-        
-        # game_over = False 
+        # skipped for headless games, those are not throttled to SPEED either
+        if self.render:
+            self._update_ui()
+            self.clock.tick(SPEED) # let's us control the speed of the game - how fast the frame updates
+        # 6. return if game over and score
+
+        # game_over = False
         return reward, game_over, self.score
-    
-    def _is_collision(self, pt = None):
+
+    def is_collision(self, pt = None):
 
         if pt is None:
-            pt = self.head
-        if pt.x > self.w - BLOCK_SIZE or pt.x < 0 or pt.y > self.h - BLOCK_SIZE or pt.y < 0: # check if edges are hit
-            return True 
-        if pt in self.snake[1:]: # exclude the snake's head, start at idx 1
-            return True  
+            cell = self.head_cell
+        else:
+            if pt.x > self.w - BLOCK_SIZE or pt.x < 0 or pt.y > self.h - BLOCK_SIZE or pt.y < 0: # check if edges are hit
+                return True
+            cell = self._cell(pt)
+        # pt in self.snake[1:] or a wall, O(1) with the occupancy grid:
+        # exclude the snake's head (snake[0]) from the count
+        count = self._occupied[cell]
+        if cell == self.head_cell:
+            count -= 1
+        if count > 0:
+            return True
 
         return False
 
+    def blocked(self, cell):
+        # wall or snake on a cell next to the head (or anywhere but the head itself)
+        return self._occupied[cell] > 0
+
+    def cell_xy(self, cell):
+        # x, y in cells of a cell index (-1 or cols/rows: just outside the board)
+        y, x = divmod(cell, self.stride)
+        return x - PAD, y - PAD
+
+    # cell <-> pixel conversion:
+    def _cell(self, pt):
+        # cell index of a point (on the board or 1 cell outside)
+        return (int(pt.y) // BLOCK_SIZE + PAD) * self.stride + int(pt.x) // BLOCK_SIZE + PAD
+
+    def _point(self, cell):
+        x, y = self.cell_xy(cell)
+        return Point(x * BLOCK_SIZE, y * BLOCK_SIZE)
+
+    # occupancy grid helpers:
+    def _occupy(self, cell):
+        # a snake entry was added on cell
+        self._occupied[cell] += 1
+        i = self._free_pos[cell]
+        if i >= 0:
+            # swap-remove the cell from the free-cell index
+            last = self._free_cells.pop()
+            if last != cell:
+                self._free_cells[i] = last
+                self._free_pos[last] = i
+            self._free_pos[cell] = -1
+            if self._solid is not None:
+                self._set_solid(cell, 1)
+
+    def _vacate(self, cell):
+        # a snake entry was removed from cell
+        self._occupied[cell] -= 1
+        if self._occupied[cell] == 0:
+            # the cell is empty again, append it to the free-cell index
+            self._free_pos[cell] = len(self._free_cells)
+            self._free_cells.append(cell)
+            if self._solid is not None:
+                self._set_solid(cell, 0)
+
+    def _set_solid(self, cell, value):
+        # body on/off a board cell in the 4 ray layouts
+        for solid, index in zip(self._solid, self._ray_tables.index):
+            solid[index[cell]] = value
+
+    def rays(self):
+        # 8 rays from the head, clockwise starting straight ahead (ahead, ahead-right, right, ..., ahead-left),
+        # 3 values each: 1/distance to the wall, 1/distance to the first body cell (0: none on the ray),
+        # 1/distance to the food (0: not on the ray); all 0 when the head left the board (game over).
+        # wall distances come from the per-board tables, the body from one bytes.find per ray,
+        # so the cost does not grow with the board
+        if self._solid is None:
+            raise ValueError('the ray features need SnakeGameAI(rays=True)')
+        rays = [0.0] * RAY_FEATURES
+        head = self.head_cell
+        tables = self._ray_tables
+        if tables.index[0][head] < 0:
+            return np.array(rays, dtype=np.float32)
+        ahead = 2 * self.dir # 8 ray directions, 2 per move direction
+        for k in range(8):
+            r = (ahead + k) & 7
+            wall = tables.wall[r][head]
+            layout, sign = RAY_LAYOUT[r]
+            solid = self._solid[layout]
+            i = tables.index[layout][head]
+            rays[3 * k] = 1 / wall
+            # the board cells on the ray are 1 .. wall - 1 steps away
+            if sign > 0:
+                j = solid.find(1, i + 1, i + wall)
+                if j >= 0:
+                    rays[3 * k + 1] = 1 / (j - i)
+            else:
+                j = solid.rfind(1, i - wall + 1, i)
+                if j >= 0:
+                    rays[3 * k + 1] = 1 / (i - j)
+        if self.food_cell >= 0:
+            head_x, head_y = self.cell_xy(head)
+            food_x, food_y = self.cell_xy(self.food_cell)
+            dx, dy = food_x - head_x, food_y - head_y
+            if (dx == 0 or dy == 0 or abs(dx) == abs(dy)) and (dx or dy):
+                r = RAY_DIRS.index(((dx > 0) - (dx < 0), (dy > 0) - (dy < 0)))
+                rays[3 * ((r - ahead) & 7) + 2] = 1 / max(abs(dx), abs(dy))
+        return np.array(rays, dtype=np.float32)
+
+    # grid observation helpers:
+    def _build_obs(self):
+        # the whole observation from the current game (new game, set_snake, load_snapshot)
+        obs = self.obs
+        obs[:] = 0
+        obs[OBS_BODY] = self.occupancy > 0
+        n = self.rows * self.cols
+        head = self._board_index[self.head_cell]
+        if head >= 0:
+            obs.reshape(-1)[OBS_HEAD * n + head] = 1
+            if self.obs_direction:
+                obs.reshape(-1)[(OBS_DIRECTION + self.dir) * n + head] = 1
+        if self.food_cell >= 0:
+            obs.reshape(-1)[OBS_FOOD * n + self._board_index[self.food_cell]] = 1
+
+    def _update_obs(self, old_head, old_dir, old_food, tail):
+        # after a step only a few cells change: old and new head, the tail that was removed (if its cell is empty now),
+        # old and new food. the new head is not drawn when it left the board (game over)
+        obs, index, n = self._obs_flat, self._board_index, self.rows * self.cols
+        cell = index[old_head]
+        obs[OBS_HEAD * n + cell] = 0.0
+        if self.obs_direction:
+            obs[(OBS_DIRECTION + old_dir) * n + cell] = 0.0
+        cell = index[self.head_cell]
+        if cell >= 0:
+            obs[OBS_BODY * n + cell] = 1.0
+            obs[OBS_HEAD * n + cell] = 1.0
+            if self.obs_direction:
+                obs[(OBS_DIRECTION + self.dir) * n + cell] = 1.0
+        if tail >= 0 and self._occupied[tail] == 0:
+            obs[OBS_BODY * n + index[tail]] = 0.0
+        if self.food_cell != old_food:
+            if old_food >= 0:
+                obs[OBS_FOOD * n + index[old_food]] = 0.0
+            if self.food_cell >= 0:
+                obs[OBS_FOOD * n + index[self.food_cell]] = 1.0
+
     # update ui helper
     def _update_ui(self):
+        # incremental rendering: between two frames only a few cells change
+        # (the new head, the old tail, the old and the new food) and maybe the score,
+        # so only those are redrawn and only their rectangles are pushed to the screen.
+        # the whole board is drawn after reset/set_snake, or when frames were skipped
+        if self._drawn is None or self._drawn[0] != self.frame_iteration - 1:
+            self._draw_all()
+            return
+        _, tail, food, score, text_rect = self._drawn
+
+        rects = [self._draw_cell(cell) for cell in {self.head_cell, tail, food, self.food_cell} if cell >= 0]
+
+        # the score text lies on top of the cells in the upper left: redraw them and the text
+        # if the score changed or one of them changed
+        text = self._score_text()
+        if score != self.score or text_rect.collidelist(rects) != -1:
+            area = text_rect.union(text.get_rect())
+            for y in range(min(-(-area.bottom // BLOCK_SIZE), self.rows)):
+                for x in range(min(-(-area.right // BLOCK_SIZE), self.cols)):
+                    rects.append(self._draw_cell((y + PAD) * self.stride + x + PAD))
+            self.display.blit(text, [0,0])
+            rects.append(area)
+
+        pygame.display.update(rects) # update only the changed parts of the screen
+        self._drawn = (self.frame_iteration, self.body[-1], self.food_cell, self.score, text.get_rect())
+
+    def _draw_all(self):
         # implement pygame function
         self.display.fill(BLACK) # fill the screen with black
         # order is IMPORTANT!
@@ -191,62 +531,342 @@ class SnakeGameAI: # agent controlled game now
         # now draw the snake
         # iterate over all the points in the snake:
         for pt in self.snake:
-            pygame.draw.rect(self.display, GREEN1, pygame.Rect(pt.x, pt.y, BLOCK_SIZE, BLOCK_SIZE)) # draw on the display for every point, 
+            pygame.draw.rect(self.display, GREEN1, pygame.Rect(pt.x, pt.y, BLOCK_SIZE, BLOCK_SIZE)) # draw on the display for every point,
             # use color blue, and draw a rectangle for the snake (in position x,y) of size BLOCK_SIZE^2
             # draw another smaller rectangle in another color and moved a bit:
-            pygame.draw.rect(self.display, WHITEISH, pygame.Rect(pt.x+4, pt.y+4, 12, 12))
+            pygame.draw.rect(self.display, WHITEISH, pygame.Rect(pt.x+INNER_OFFSET, pt.y+INNER_OFFSET, INNER_SIZE, INNER_SIZE))
 
-        # drawing the food:
-        pygame.draw.rect(self.display, RED, pygame.Rect(self.food.x, self.food.y, BLOCK_SIZE, BLOCK_SIZE))
+        # drawing the food (there is none on a full board):
+        food = self.food
+        if food is not None:
+            pygame.draw.rect(self.display, RED, pygame.Rect(food.x, food.y, BLOCK_SIZE, BLOCK_SIZE))
 
         # draw the score in the upper left:
-        # need to create a font 1st
-        text = font.render('Score: ' + str(self.score), True, WHITE)
+        text = self._score_text()
         # putting the text on the display:
         self.display.blit(text, [0,0]) # place in upper left
 
         # lastly:
         pygame.display.flip() # update the full display 'surface' to the screen
         # this is important, otherwise can't see the changes
+        self._drawn = (self.frame_iteration, self.body[-1], self.food_cell, self.score, text.get_rect())
+
+    def _draw_cell(self, cell):
+        # draw one cell as it is now (snake, food or empty), returns its rectangle
+        pt = self._point(cell)
+        rect = pygame.Rect(pt.x, pt.y, BLOCK_SIZE, BLOCK_SIZE)
+        if self._occupied[cell]:
+            pygame.draw.rect(self.display, GREEN1, rect)
+            pygame.draw.rect(self.display, WHITEISH, pygame.Rect(pt.x+INNER_OFFSET, pt.y+INNER_OFFSET, INNER_SIZE, INNER_SIZE))
+        elif cell == self.food_cell:
+            pygame.draw.rect(self.display, RED, rect)
+        else:
+            pygame.draw.rect(self.display, BLACK, rect)
+        return rect
+
+    def _score_text(self):
+        # the rendered score, only rendered again when the score changes
+        if self._text_score != self.score:
+            self._text = _get_font().render('Score: ' + str(self.score), True, WHITE)
+            self._text_score = self.score
+        return self._text
 
     def _move(self, action):
-        # [straight, right, left]
-        # clockwise order of all possible directions:
-
-        clock_wise = [Direction.RIGHT, Direction.DOWN, Direction.LEFT, Direction.UP]
-
-        # get idx of current direction
-        idx = clock_wise.index(self.direction) 
-
-        # check the different possible states
-
-        if np.array_equal(action, [1,0,0]):
-            new_dir = clock_wise[idx] # keep current direction
-        elif np.array_equal(action, [0,1,0]): # right turn
-            next_idx = (idx + 1) % 4 # if at the end (u), do the next one
-            new_dir = clock_wise[next_idx] # right turn r->d -> l -> u 
-        else: # np.array_equal(action, [0,0,1]):
-            next_idx = (idx - 1) % 4 # meaning we go counter clockwise
-            # left turn r-> u -> l -> d 
-            new_dir = clock_wise[next_idx]
-
-
-        self.direction = new_dir
-
-        # extract x,y:
-        x = self.head.x 
-        y = self.head.y 
-        # check direction:
-        if self.direction == Direction.RIGHT: 
-            x += BLOCK_SIZE
-        elif self.direction == Direction.LEFT: 
-            x -= BLOCK_SIZE
-        elif self.direction == Direction.UP: 
-            y -= BLOCK_SIZE
-        elif self.direction == Direction.DOWN: # BECAUSE WE START AT 0 AT THE TOP, WE ADD  
-            y += BLOCK_SIZE
-
-        self.head = Point(x,y)
+        # action: 0 straight, 1 right turn, 2 left turn
+        # (a one-hot [straight, right, left] list/array or a 1-element array works too)
+        if not isinstance(action, int):
+            action = action_index(action)
+
+        # the directions are numbered clockwise (CLOCK_WISE: right, down, left, up),
+        # the new direction comes from a lookup table: right turn r->d -> l -> u, left turn r-> u -> l -> d
+        self.dir = NEXT_DIR[self.dir][action]
+
+        # one step in the new direction (down is +stride: WE START AT 0 AT THE TOP)
+        self.head_cell += self.steps[self.dir]
+
+
+# number of channels of the grid observation
+def obs_channels(direction=False):
+    return OBS_DIRECTION + 4 if direction else OBS_DIRECTION
+
+
+# ray features: 8 directions clockwise from right (x, y steps in cells), 2 per move direction (ray 2 * direction code)
+RAY_DIRS = [(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)]
+RAY_FEATURES = 3 * len(RAY_DIRS) # wall, body and food per ray
+# the layout that has each ray's line in consecutive bytes (0 rows, 1 columns, 2 diagonals, 3 anti-diagonals)
+# and the index step along the ray in it
+RAY_LAYOUT = [(0, 1), (2, 1), (1, 1), (3, 1), (0, -1), (2, -1), (1, -1), (3, -1)]
+RayTables = namedtuple('RayTables', 'wall, index, sizes')
+
+
+@lru_cache(maxsize=None)
+def _ray_tables(cols, rows):
+    # per board size, lists over the padded cells of SnakeGameAI (like the occupancy grid):
+    # wall[ray][cell] = steps to the first wall, index[layout][cell] = position in the layout (-1 outside the board)
+    stride = cols + 2 * PAD
+    y, x = np.divmod(np.arange((rows + 2 * PAD) * stride), stride)
+    x, y = x - PAD, y - PAD
+    board = (x >= 0) & (x < cols) & (y >= 0) & (y < rows)
+    far = cols + rows # more than any distance on the board
+    wall = []
+    for dx, dy in RAY_DIRS:
+        steps_x = np.where(dx > 0, cols - x, x + 1) if dx else far
+        steps_y = np.where(dy > 0, rows - y, y + 1) if dy else far
+        wall.append(np.where(board, np.minimum(steps_x, steps_y), 0).tolist())
+    positions = [y * cols + x, x * rows + y, (x - y + rows - 1) * rows + y, (x + y) * rows + y]
+    index = [np.where(board, p, -1).tolist() for p in positions]
+    sizes = [cols * rows, cols * rows, (cols + rows - 1) * rows, (cols + rows - 1) * rows]
+    return RayTables(wall, index, sizes)
+
+
+# clockwise order of the directions, used as integer direction codes by the vectorized env:
+# 0 = RIGHT, 1 = DOWN, 2 = LEFT, 3 = UP
+CLOCK_WISE = [Direction.RIGHT, Direction.DOWN, Direction.LEFT, Direction.UP]
+DX = np.array([1, 0, -1, 0]) # x step (in cells) for each direction code
+DY = np.array([0, 1, 0, -1]) # y step (in cells) for each direction code
+TURN = np.array([0, 1, -1]) # [straight, right, left] -> change of the direction code
+# the direction code after an action: NEXT_DIR[direction code][action], action 0 straight, 1 right, 2 left
+NEXT_DIR = tuple(tuple((d + turn) % 4 for turn in (0, 1, -1)) for d in range(4))
+
+
+def action_index(action):
+    # actions come as an index 0, 1, 2 (int, numpy integer, 0-d or 1-element array)
+    # or as one-hot [straight, right, left] lists/arrays
+    if isinstance(action, (int, np.integer)):
+        return action
+    if isinstance(action, list):
+        return action.index(1) if len(action) > 1 else operator.index(action[0])
+    action = np.asarray(action)
+    if action.size == 1:
+        return operator.index(action.item())
+    return int(np.argmax(action))
+
+
+# many games at once:
+class VectorSnakeEnv:
+
+    '''
+    Steps n_envs snake games together, every game lives in numpy arrays:
+    * heads (n_envs, 2), foods (n_envs, 2) - x, y in cells (not pixels)
+    * directions (n_envs,) - index into CLOCK_WISE
+    * occupancy (n_envs, rows, cols) - how many snake entries are on each cell
+    * body - ring buffer of flat cell indices per game (tail ... head)
+    * scores, frame_iterations (n_envs,)
+    * ends (n_envs,) - how every game ended in the last step: END_WALL, END_BODY, END_TIMEOUT, END_WON (END_NONE: running)
+
+    step(actions) -> rewards, dones, scores for all games, finished games are reset automatically.
+    The rules are the same as SnakeGameAI.play_step (same start snake, collision, food and timeout).
+
+    obs_grid=True: obs (n_envs, channels, rows, cols) float32, the grid observation of every game
+    like SnakeGameAI.obs, updated in place on every step (obs_direction: + the direction channels)
+    '''
+
+    def __init__(self, n_envs, w=640, h=480, seed=None, obs_grid=False, obs_direction=False, cols=None, rows=None):
+        self.n_envs = n_envs
+        self.w = w if cols is None else cols * BLOCK_SIZE
+        self.h = h if rows is None else rows * BLOCK_SIZE
+        self.cols = self.w // BLOCK_SIZE
+        self.rows = self.h // BLOCK_SIZE
+        if self.cols < 4 or self.rows < 1:
+            raise ValueError('the board needs at least 4x1 cells for the start snake, got %dx%d' % (self.cols, self.rows))
+        self.n_cells = self.cols * self.rows
+        self.rng = np.random.default_rng(seed)
+
+        self.heads = np.zeros((n_envs, 2), dtype=np.int64)
+        self.directions = np.zeros(n_envs, dtype=np.int64)
+        self.foods = np.zeros((n_envs, 2), dtype=np.int64)
+        self.occupancy = np.zeros((n_envs, self.rows, self.cols), dtype=np.uint8)
+        self._occ = self.occupancy.reshape(n_envs, self.n_cells) # flat view, same memory
+        # the snake list is at most 1 longer than the board (the start snake has the head twice)
+        self._capacity = self.n_cells + 1
+        self.body = np.zeros((n_envs, self._capacity), dtype=np.int64)
+        self.tails = np.zeros(n_envs, dtype=np.int64) # ring position of the tail
+        self.lengths = np.zeros(n_envs, dtype=np.int64) # len(game.snake)
+        self.scores = np.zeros(n_envs, dtype=np.int64)
+        self.frame_iterations = np.zeros(n_envs, dtype=np.int64)
+        self.ends = np.zeros(n_envs, dtype=np.int8)
+        self._all = np.arange(n_envs)
+        self.obs = None
+        self.obs_direction = obs_direction
+        if obs_grid:
+            self.obs = np.zeros((n_envs, obs_channels(obs_direction), self.rows, self.cols), dtype=np.float32)
+            self._obs_flat = self.obs.reshape(n_envs, -1) # flat view, same memory
+
+        self.reset()
+
+    def reset(self, mask=None):
+        # reset all games, or only the ones where mask is True
+        idx = self._all if mask is None else np.flatnonzero(mask)
+        if idx.size == 0:
+            return
+
+        # same start as SnakeGameAI.reset: head in the middle, moving right,
+        # snake = [head, head - 1 block, head, head - 2 blocks]
+        x = int(self.w / 2) // BLOCK_SIZE
+        y = int(self.h / 2) // BLOCK_SIZE
+        head = y * self.cols + x
+        self.heads[idx] = (x, y)
+        self.directions[idx] = 0
+        self.occupancy[idx] = 0
+        # ring buffer holds the snake list reversed (tail first)
+        start = np.array([head - 2, head, head - 1, head])
+        self.body[idx, :4] = start
+        self.tails[idx] = 0
+        self.lengths[idx] = 4
+        for cell in start:
+            self._occ[idx, cell] += 1
+        self.scores[idx] = 0
+        self.frame_iterations[idx] = 0
+        self._place_food(idx)
+        if self.obs is not None:
+            self._build_obs(idx)
+
+    def _build_obs(self, idx):
+        # grid observation of the games idx from scratch
+        n = self.n_cells
+        self.obs[idx] = 0
+        self.obs[idx, OBS_BODY] = self.occupancy[idx] > 0
+        heads = self.heads[idx, 1] * self.cols + self.heads[idx, 0]
+        self._obs_flat[idx, OBS_HEAD * n + heads] = 1
+        if self.obs_direction:
+            self._obs_flat[idx, (OBS_DIRECTION + self.directions[idx]) * n + heads] = 1
+        has_food = self.foods[idx, 0] >= 0
+        idx = idx[has_food]
+        self._obs_flat[idx, OBS_FOOD * n + self.foods[idx, 1] * self.cols + self.foods[idx, 0]] = 1
+
+    def _place_food(self, idx):
+        # a few rounds of vectorized rejection sampling, like SnakeGameAI._place_food
+        for _ in range(8):
+            if idx.size == 0:
+                return
+            cells = self.rng.integers(0, self.n_cells, idx.size)
+            free = self._occ[idx, cells] == 0
+            self.foods[idx[free], 0] = cells[free] % self.cols
+            self.foods[idx[free], 1] = cells[free] // self.cols
+            idx = idx[~free]
+
+        # (nearly) full boards: pick directly from the free cells
+        for i in idx:
+            free_cells = np.flatnonzero(self._occ[i] == 0)
+            if free_cells.size == 0:
+                self.foods[i] = (-1, -1) # no place left for food
+                continue
+            cell = free_cells[self.rng.integers(free_cells.size)]
+            self.foods[i] = (cell % self.cols, cell // self.cols)
+
+    def snapshot(self, i=0):
+        # SnakeGameAI.snapshot of game i
+        ring = (self.tails[i] + np.arange(self.lengths[i])) % self._capacity
+        body = self.body[i, ring[::-1]].astype(np.int32) # the ring is tail first
+        food = -1 if self.foods[i, 0] < 0 else self.foods[i, 1] * self.cols + self.foods[i, 0]
+        return body, int(food), int(self.scores[i])
+
+    def step(self, actions):
+        # actions: (n_envs, 3) one-hot [straight, right, left] or (n_envs,) indices 0, 1, 2
+        actions = np.asarray(actions)
+        if actions.ndim == 2:
+            actions = actions.argmax(axis=1)
+
+        self.frame_iterations += 1
+        if self.obs is not None:
+            old_heads = self.heads[:, 1] * self.cols + self.heads[:, 0]
+            old_directions = self.directions
+
+        # move the heads
+        self.directions = (self.directions + TURN[actions]) % 4
+        x = self.heads[:, 0] + DX[self.directions]
+        y = self.heads[:, 1] + DY[self.directions]
+        self.heads[:, 0] = x
+        self.heads[:, 1] = y
+
+        # game over: wall, body (the whole old snake, the tail has not moved yet) or too long without food
+        wall = (x < 0) | (x >= self.cols) | (y < 0) | (y >= self.rows)
+        cells = np.clip(y, 0, self.rows - 1) * self.cols + np.clip(x, 0, self.cols - 1)
+        body = self._occ[self._all, cells] > 0
+        timeout = self.frame_iterations > 100 * (self.lengths + 1)
+        dones = wall | body | timeout
+        alive = ~dones
+        # the first reason counts, like in play_step: wall, then body, then timeout
+        self.ends = np.zeros(self.n_envs, dtype=np.int8)
+        self.ends[timeout] = END_TIMEOUT
+        self.ends[body] = END_BODY
+        self.ends[wall] = END_WALL
+        ate = alive & (x == self.foods[:, 0]) & (y == self.foods[:, 1])
+
+        rewards = np.zeros(self.n_envs, dtype=np.int64)
+        rewards[dones] = -10
+        rewards[ate] = 10
+
+        # insert the new head
+        idx = np.flatnonzero(alive)
+        cells = cells[idx]
+        self.body[idx, (self.tails[idx] + self.lengths[idx]) % self._capacity] = cells
+        self._occ[idx, cells] += 1
+        self.lengths[idx] += 1
+
+        # remove the tail if nothing was eaten, else place new food
+        moved = np.flatnonzero(alive & ~ate)
+        tails = self.tails[moved]
+        tail_cells = self.body[moved, tails]
+        self._occ[moved, tail_cells] -= 1
+        self.tails[moved] = (tails + 1) % self._capacity
+        self.lengths[moved] -= 1
+
+        self.scores[ate] += 1
+        self._place_food(np.flatnonzero(ate))
+
+        # grid observation of the games that go on: old head off, new head on, empty tail cells off,
+        # eaten food off (it is under the new head) and the new food on. finished games are rebuilt by reset
+        if self.obs is not None:
+            n = self.n_cells
+            obs = self._obs_flat
+            obs[idx, OBS_HEAD * n + old_heads[idx]] = 0
+            obs[idx, OBS_BODY * n + cells] = 1
+            obs[idx, OBS_HEAD * n + cells] = 1
+            if self.obs_direction:
+                obs[idx, (OBS_DIRECTION + old_directions[idx]) * n + old_heads[idx]] = 0
+                obs[idx, (OBS_DIRECTION + self.directions[idx]) * n + cells] = 1
+            empty = self._occ[moved, tail_cells] == 0
+            obs[moved[empty], OBS_BODY * n + tail_cells[empty]] = 0
+            eaten = np.flatnonzero(ate)
+            obs[eaten, OBS_FOOD * n + self.heads[eaten, 1] * self.cols + self.heads[eaten, 0]] = 0
+            fed = eaten[self.foods[eaten, 0] >= 0]
+            obs[fed, OBS_FOOD * n + self.foods[fed, 1] * self.cols + self.foods[fed, 0]] = 1
+
+        # the snake fills the board: no food could be placed, game won
+        won = ate & (self.foods[:, 0] < 0)
+        dones |= won
+        self.ends[won] = END_WON
+
+        scores = self.scores.copy() # final scores of the finished games, before the reset
+        self.reset(dones)
+        return rewards, dones, scores
+
+
+# the 11 states for a whole batch of games at once, in a few numpy operations:
+# heads, foods (n, 2) x, y in cells; directions (n,) index into CLOCK_WISE; occupancy (n, rows, cols)
+# gives exactly the same values as Agent.get_state (foods with x < 0 mean: no food, all food flags 0)
+def encode_states(heads, directions, foods, occupancy):
+    n, rows, cols = occupancy.shape
+    occupancy = occupancy.reshape(n, rows * cols)
+
+    # the cells straight, right and left of the head
+    dirs = (directions[:, None] + TURN) % 4
+    x = heads[:, 0, None] + DX[dirs]
+    y = heads[:, 1, None] + DY[dirs]
+    wall = (x < 0) | (x >= cols) | (y < 0) | (y >= rows)
+    cells = np.clip(y, 0, rows - 1) * cols + np.clip(x, 0, cols - 1)
+    body = occupancy[np.arange(n)[:, None], cells] > 0
+
+    has_food = foods[:, 0] >= 0
+    states = np.empty((n, 11), dtype=int)
+    states[:, 0:3] = wall | body # danger straight, right, left
+    states[:, 3:7] = directions[:, None] == [2, 0, 3, 1] # move direction left, right, up, down
+    states[:, 7] = has_food & (foods[:, 0] < heads[:, 0]) # food left
+    states[:, 8] = has_food & (foods[:, 0] > heads[:, 0]) # food right
+    states[:, 9] = has_food & (foods[:, 1] < heads[:, 1]) # food up
+    states[:, 10] = has_food & (foods[:, 1] > heads[:, 1]) # food down
+    return states
 
 
 # NO LONGER NEEDED:
@@ -0,0 +1,107 @@
+import os
+import sys
+import numpy as np
+
+'''
+NumPy inference for the Q-network, without torch.
+
+Linear_QNet is tiny (11 inputs, 1 hidden layer of 256, 3 outputs): a forward pass is ~3,000
+multiply-adds, far less than torch's per-call overhead, and importing torch takes longer than
+playing a game. NumpyQNet does the same forward pass with two numpy matrix products:
+
+* export: the weights of a trained Linear_QNet as a .npz file (the state_dict names, float32)
+* forward(states): Q values of one state (input_size,) -> (3,) or a batch (n, input_size) -> (n, 3)
+* predict_actions(states) / action(state): the greedy moves 0, 1, 2, like Agent.predict_actions
+
+This module only needs numpy; torch is imported only to export from a .pth file.
+Without torch: Agent(engine=...) (get_state, get_action, get_actions) and evaluate.py with .npz/.npy models.
+Training (train(), Agent without engine, checkpoints) still needs torch.
+
+    python inference.py model/model.pth              # -> model/model.npz
+    agent = Agent(engine=NumpyQNet.load('model/model.npz'))   # a player: get_action without torch
+    agent.engine = NumpyQNet.from_model(agent.model)          # a trained agent plays with the copy
+    python evaluate.py model/model.npz               # the evaluation without torch
+'''
+
+# the weights in the order of the forward pass, named like the state_dict of Linear_QNet
+WEIGHTS = ['linear1.weight', 'linear1.bias', 'linear2.weight', 'linear2.bias']
+
+
+class NumpyQNet:
+
+    # w1 (hidden, input), b1 (hidden,), w2 (output, hidden), b2 (output,): the layout of the torch layers
+    def __init__(self, w1, b1, w2, b2):
+        # stored transposed: x @ w1t is the product torch computes for x @ w1.T
+        self.w1t = np.ascontiguousarray(np.asarray(w1, dtype=np.float32).T)
+        self.b1 = np.asarray(b1, dtype=np.float32)
+        self.w2t = np.ascontiguousarray(np.asarray(w2, dtype=np.float32).T)
+        self.b2 = np.asarray(b2, dtype=np.float32)
+        self.input_size, self.hidden_size = self.w1t.shape
+        self.output_size = self.w2t.shape[1]
+        # hidden layer buffer for batches, grown when a bigger batch comes
+        self._hidden = np.empty((0, self.hidden_size), dtype=np.float32)
+
+    @classmethod
+    def from_model(cls, model):
+        # a copy of the current weights of a Linear_QNet
+        state = model.state_dict()
+        return cls(*(state[name].detach().cpu().numpy() for name in WEIGHTS))
+
+    @classmethod
+    def load(cls, file_name):
+        with np.load(file_name) as weights:
+            return cls(*(weights[name] for name in WEIGHTS))
+
+    def save(self, file_name='model.npz'):
+        # into ./model like Linear_QNet.save, unless the name has a directory
+        if not os.path.dirname(file_name):
+            if not os.path.exists('./model'):
+                os.makedirs('./model')
+            file_name = os.path.join('./model', file_name)
+        np.savez(file_name, **dict(zip(WEIGHTS, (self.w1t.T, self.b1, self.w2t.T, self.b2))))
+
+    def forward(self, states):
+        x = np.asarray(states, dtype=np.float32)
+        if x.ndim == 1:
+            # one state: small vector products, no buffer
+            hidden = x @ self.w1t
+            hidden += self.b1
+            np.maximum(hidden, 0, out=hidden)
+            q = hidden @ self.w2t
+            q += self.b2
+            return q
+        n = len(x)
+        if n > len(self._hidden):
+            self._hidden = np.empty((n, self.hidden_size), dtype=np.float32)
+        hidden = np.matmul(x, self.w1t, out=self._hidden[:n])
+        hidden += self.b1
+        np.maximum(hidden, 0, out=hidden) # relu
+        q = hidden @ self.w2t
+        q += self.b2
+        return q
+
+    # like Linear_QNet.predict
+    predict = forward
+
+    def predict_actions(self, states):
+        # (n, input_size) states -> (n,) greedy actions
+        return self.forward(states).argmax(axis=1)
+
+    def action(self, state):
+        # one state -> the greedy move as an int
+        return int(self.forward(state).argmax())
+
+
+def export(pth_file='model/model.pth', npz_file=None):
+    # Linear_QNet weights saved by torch -> the same weights as .npz (needs torch, only here)
+    import torch
+    state = torch.load(pth_file, weights_only=True)
+    net = NumpyQNet(*(state[name].numpy() for name in WEIGHTS))
+    if npz_file is None:
+        npz_file = os.path.splitext(pth_file)[0] + '.npz'
+    net.save(npz_file)
+    return npz_file
+
+
+if __name__ == '__main__':
+    print(export(*sys.argv[1:3]))
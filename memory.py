@@ -0,0 +1,333 @@
+import os
+import numpy as np
+from game import action_index # one-hot action -> 0, 1, 2
+
+# replay memory (experience replay) for the agent:
+# instead of a deque of python tuples we keep every field of the transitions
+# in its own preallocated numpy array, used as a ring buffer
+
+
+class ReplayMemory:
+
+    '''
+    Transitions (state, action, reward, next_state, done) in preallocated typed arrays:
+    * append() is O(1), once capacity is reached the oldest transition is overwritten (like deque(maxlen=...))
+    * sample() draws a random batch with one fancy-indexing operation per field and returns
+      contiguous arrays, ready for the trainer (torch.from_numpy works on them without a copy)
+    * memory use is fixed up front: nbytes
+    * with path=<directory> the arrays are memory-mapped .npy files in that directory:
+      flush() writes them to disk without copying through python, and an existing
+      directory is opened again (resume, the counters come back with load_state_dict())
+    '''
+
+    def __init__(self, capacity, state_size=11, state_dtype=np.float32, seed=None, path=None):
+        self.capacity = capacity
+        self.path = path
+        if self.path is not None:
+            os.makedirs(self.path, exist_ok=True)
+        self.states = self._array('states', (capacity, state_size), state_dtype)
+        self.actions = self._array('actions', (capacity,), np.int64) # action index: 0 straight, 1 right, 2 left
+        self.rewards = self._array('rewards', (capacity,), np.float32)
+        self.next_states = self._array('next_states', (capacity, state_size), state_dtype)
+        self.dones = self._array('dones', (capacity,), np.bool_)
+        self.position = 0 # where the next transition is written
+        self.size = 0 # how many transitions are stored
+        self.rng = np.random.default_rng(seed)
+
+    def _array(self, name, shape, dtype):
+        # a zeroed array in RAM, or a memory-mapped .npy file in self.path
+        if self.path is None:
+            return np.zeros(shape, dtype=dtype)
+        file_name = os.path.join(self.path, name + '.npy')
+        if os.path.exists(file_name):
+            array = np.lib.format.open_memmap(file_name, mode='r+')
+            # the memory of another run (other capacity, state size or memory type) can't be resumed
+            if array.shape != shape or array.dtype != np.dtype(dtype):
+                raise ValueError('%s holds a %s %s array, this memory needs %s %s (capacity, state size or memory type changed)'
+                                 % (file_name, array.shape, array.dtype, shape, np.dtype(dtype)))
+            return array
+        return np.lib.format.open_memmap(file_name, mode='w+', dtype=dtype, shape=shape)
+
+    def flush(self):
+        # write the memory-mapped arrays to disk (nothing to do in RAM)
+        for array in vars(self).values():
+            if isinstance(array, np.memmap):
+                array.flush()
+
+    # the counters and the rng, small enough to go into a checkpoint
+    def state_dict(self):
+        return {'position': self.position, 'size': self.size, 'rng': self.rng.bit_generator.state}
+
+    def load_state_dict(self, state):
+        self.position = state['position']
+        self.size = state['size']
+        self.rng.bit_generator.state = state['rng']
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        return (self.states.nbytes + self.actions.nbytes + self.rewards.nbytes
+                + self.next_states.nbytes + self.dones.nbytes)
+
+    def append(self, state, action, reward, next_state, done):
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action_index(action)
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        self.position = (i + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def extend(self, states, actions, rewards, next_states, dones):
+        # append a whole batch at once (e.g. one step of VectorSnakeEnv),
+        # actions are indices here (or one-hot rows)
+        actions = np.asarray(actions)
+        if actions.ndim == 2:
+            actions = actions.argmax(axis=1)
+        states, actions, rewards, next_states, dones = self._last_rows(states, actions, rewards, next_states, dones)
+        n = len(actions)
+        idx = (self.position + np.arange(n)) % self.capacity
+        self.states[idx] = states
+        self.actions[idx] = actions
+        self.rewards[idx] = rewards
+        self.next_states[idx] = next_states
+        self.dones[idx] = dones
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def _last_rows(self, *fields):
+        # a batch bigger than the memory: only its last capacity rows survive, write just those
+        # (every slot once, the same result as writing all rows in order)
+        skip = len(fields[1]) - self.capacity
+        if skip <= 0:
+            return fields
+        self.position = (self.position + skip) % self.capacity
+        return tuple(np.asarray(field)[skip:] for field in fields)
+
+    def take(self, idx):
+        # the transitions at the given indices, one array per field
+        return (self.states[idx], self.actions[idx], self.rewards[idx],
+                self.next_states[idx], self.dones[idx])
+
+    def sample(self, batch_size):
+        # random batch (with replacement), if we don't have batch_size transitions yet take all of them
+        if self.size <= batch_size:
+            return self.take(np.arange(self.size))
+        idx = self.rng.integers(0, self.size, batch_size)
+        return self.take(idx)
+
+
+# sum-tree for prioritized replay:
+class SumTree:
+
+    '''
+    Binary tree in one array: tree[1] is the root, the children of node i are 2i and 2i+1,
+    the leaves (one per memory slot) start at index self.leaf_start.
+    Every node holds the sum of the priorities below it, so
+    * update() (set priorities) and
+    * find() (the leaf where the running sum of priorities reaches a value)
+    are O(log n) - both work on a whole batch of indices/values at once.
+    '''
+
+    # tree: a preallocated array of size tree_size(capacity) to use (e.g. memory-mapped), None = new array
+    def __init__(self, capacity, tree=None):
+        self.leaf_start = 1
+        while self.leaf_start < capacity:
+            self.leaf_start *= 2
+        self.depth = self.leaf_start.bit_length() - 1
+        self.tree = np.zeros(2 * self.leaf_start, dtype=np.float64) if tree is None else tree
+
+    @staticmethod
+    def tree_size(capacity):
+        return 2 * (1 << max(capacity - 1, 0).bit_length())
+
+    @property
+    def total(self):
+        return self.tree[1]
+
+    def priorities(self, idx):
+        return self.tree[self.leaf_start + idx]
+
+    def update(self, idx, priorities):
+        nodes = self.leaf_start + np.asarray(idx)
+        self.tree[nodes] = priorities
+        # recompute the sums on the way up to the root
+        for _ in range(self.depth):
+            nodes = nodes // 2
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def rebuild(self):
+        # recompute every sum from the leaves, one level at a time
+        tree = self.tree
+        start = self.leaf_start
+        while start > 1:
+            start //= 2
+            tree[start:2 * start] = tree[2 * start:4 * start:2] + tree[2 * start + 1:4 * start:2]
+
+    def update_one(self, i, priority):
+        # the same for a single index, plain python is faster than numpy here
+        tree = self.tree
+        node = self.leaf_start + i
+        tree[node] = priority
+        while node > 1:
+            node //= 2
+            tree[node] = tree[2 * node] + tree[2 * node + 1]
+
+    def find(self, values):
+        # walk down from the root: go left if the value fits into the left subtree, else go right
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            go_right = values > self.tree[left]
+            values -= np.where(go_right, self.tree[left], 0.0)
+            nodes = left + go_right
+        return nodes - self.leaf_start
+
+
+class PrioritizedReplayMemory(ReplayMemory):
+
+    '''
+    Prioritized experience replay: transitions are sampled proportional to priority^alpha
+    (priority = |TD error| + eps, new transitions get the highest priority seen so far).
+    sample() also returns the importance-sampling weights (for the trainer's loss) and the
+    indices, the TD errors of the train step go back with update_priorities().
+    beta is annealed from beta to 1 by beta_increment per sample.
+    '''
+
+    def __init__(self, capacity, state_size=11, state_dtype=np.float32, seed=None, path=None,
+                 alpha=0.6, beta=0.4, beta_increment=1e-4, eps=1e-5):
+        super().__init__(capacity, state_size, state_dtype, seed, path)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.eps = eps
+        self.max_priority = 1.0
+        self.priorities = self._array('priorities', (SumTree.tree_size(capacity),), np.float64)
+        self.tree = SumTree(capacity, self.priorities)
+
+    def state_dict(self):
+        state = super().state_dict()
+        state.update(beta=self.beta, max_priority=self.max_priority)
+        return state
+
+    def load_state_dict(self, state):
+        super().load_state_dict(state)
+        self.beta = state['beta']
+        self.max_priority = state['max_priority']
+        # the memory-mapped tree may be ahead of the counters (training went on after the checkpoint):
+        # slots past size hold no transition of this state, and every sum is recomputed from the leaves
+        if self.size < self.capacity:
+            self.tree.tree[self.tree.leaf_start + self.size:] = 0.0
+        self.tree.rebuild()
+
+    def append(self, state, action, reward, next_state, done):
+        i = self.position
+        super().append(state, action, reward, next_state, done)
+        self.tree.update_one(i, self.max_priority ** self.alpha)
+
+    def extend(self, states, actions, rewards, next_states, dones):
+        idx = (self.position + np.arange(len(actions))) % self.capacity
+        super().extend(states, actions, rewards, next_states, dones)
+        self.tree.update(idx, self.max_priority ** self.alpha)
+
+    def sample(self, batch_size):
+        # -> states, actions, rewards, next_states, dones, weights, indices
+        if self.size <= batch_size:
+            idx = np.arange(self.size)
+        else:
+            # stratified: one value from each of batch_size equal segments of the total priority
+            segment = self.tree.total / batch_size
+            values = (np.arange(batch_size) + self.rng.random(batch_size)) * segment
+            idx = np.minimum(self.tree.find(values), self.size - 1)
+
+        probs = self.tree.priorities(idx) / self.tree.total
+        weights = (self.size * probs) ** -self.beta
+        weights = (weights / weights.max()).astype(np.float32)
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        return self.take(idx) + (weights, idx)
+
+    def update_priorities(self, idx, td_errors):
+        priorities = np.abs(td_errors) + self.eps
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(idx, priorities ** self.alpha)
+
+
+# bit-packed replay memory:
+class CompactReplayMemory(ReplayMemory):
+
+    '''
+    The same ring buffer, but every transition takes ~6 bytes instead of ~100:
+    * states / next_states: the binary features packed into one uint16 (bit i = feature i, up to 16 features)
+    * actions: uint8 index, rewards: int8 (-10, 0, 10), dones: 1 bit each
+    take() / sample() unpack a whole batch at once and return the same arrays as ReplayMemory
+    (float32 states and rewards, int64 actions, bool dones).
+    '''
+
+    def __init__(self, capacity, state_size=11, seed=None, path=None):
+        assert state_size <= 16, 'a packed state has at most 16 features'
+        self.capacity = capacity
+        self.state_size = state_size
+        self.path = path
+        if self.path is not None:
+            os.makedirs(self.path, exist_ok=True)
+        self.states = self._array('states', (capacity,), np.uint16)
+        self.actions = self._array('actions', (capacity,), np.uint8)
+        self.rewards = self._array('rewards', (capacity,), np.int8)
+        self.next_states = self._array('next_states', (capacity,), np.uint16)
+        self.dones = self._array('dones', ((capacity + 7) // 8,), np.uint8) # 8 dones per byte
+        self.position = 0
+        self.size = 0
+        self.rng = np.random.default_rng(seed)
+        self._bits = 1 << np.arange(state_size) # feature i -> bit i
+
+    def pack(self, states):
+        # (..., state_size) 0/1 -> (...) uint16
+        return (np.asarray(states) @ self._bits).astype(np.uint16)
+
+    def unpack(self, packed):
+        # (n,) uint16 -> (n, state_size) float32 0/1
+        return ((packed[:, None] & self._bits) != 0).astype(np.float32)
+
+    def append(self, state, action, reward, next_state, done):
+        i = self.position
+        self.states[i] = self.pack(state)
+        self.actions[i] = action_index(action)
+        self.rewards[i] = reward
+        self.next_states[i] = self.pack(next_state)
+        if done:
+            self.dones[i >> 3] |= 1 << (i & 7)
+        else:
+            self.dones[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+        self.position = (i + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def extend(self, states, actions, rewards, next_states, dones):
+        actions = np.asarray(actions)
+        if actions.ndim == 2:
+            actions = actions.argmax(axis=1)
+        states, actions, rewards, next_states, dones = self._last_rows(states, actions, rewards, next_states, dones)
+        n = len(actions)
+        idx = (self.position + np.arange(n)) % self.capacity
+        self.states[idx] = self.pack(states)
+        self.actions[idx] = actions
+        self.rewards[idx] = rewards
+        self.next_states[idx] = self.pack(next_states)
+        # set the done bits (ufunc.at: several of them can be in the same byte)
+        masks = (1 << (idx & 7)).astype(np.uint8)
+        np.bitwise_and.at(self.dones, idx >> 3, ~masks)
+        np.bitwise_or.at(self.dones, idx >> 3, masks * np.asarray(dones, dtype=np.uint8))
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def take(self, idx):
+        idx = np.asarray(idx)
+        dones = (self.dones[idx >> 3] >> (idx & 7)) & 1
+        return (self.unpack(self.states[idx]), self.actions[idx].astype(np.int64),
+                self.rewards[idx].astype(np.float32), self.unpack(self.next_states[idx]),
+                dones.astype(np.bool_))
@@ -0,0 +1,187 @@
+import csv
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+'''
+Metrics of the training loop.
+
+* every finished game becomes one record (dict): game, score, record, steps, updates,
+  elapsed time and steps/games/updates per second, sent to all sinks
+* with timing=True the loop phases (play_step, get_state, get_action, remember,
+  train_short_memory, train_long_memory) are timed too, cumulative seconds per phase
+  go into the records as time_<phase>
+* timing is off by default: phase() then returns a shared no-op timer
+
+Sinks: StdoutSink (the classic 'Game: .. Score: .. Record: ..' line + a phase summary),
+JSONLSink and CSVSink (files), HTTPSink (latest record and history as JSON on a local port).
+'''
+
+
+class _Timer:
+
+    # adds the time spent inside 'with' to times[name]
+    def __init__(self, times, name):
+        self.times = times
+        self.name = name
+        self.times[name] = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.times[self.name] += time.perf_counter() - self.start
+
+
+class _NullTimer:
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+
+    def __init__(self, sinks=None, timing=False):
+        self.sinks = [StdoutSink()] if sinks is None else list(sinks)
+        self.timing = timing
+        self.times = {} # phase -> cumulative seconds
+        self._timers = {}
+        self.start = time.perf_counter()
+
+    def phase(self, name):
+        # with metrics.phase('play_step'): ...
+        if not self.timing:
+            return _NULL_TIMER
+        timer = self._timers.get(name)
+        if timer is None:
+            timer = self._timers[name] = _Timer(self.times, name)
+        return timer
+
+    def log_game(self, game, score, record, steps, updates):
+        elapsed = time.perf_counter() - self.start
+        rec = {
+            'game': game,
+            'score': score,
+            'record': record,
+            'steps': steps,
+            'updates': updates,
+            'elapsed': elapsed,
+            'steps_per_sec': steps / elapsed,
+            'games_per_sec': game / elapsed,
+            'updates_per_sec': updates / elapsed,
+        }
+        for name, seconds in self.times.items():
+            rec['time_' + name] = seconds
+        for sink in self.sinks:
+            sink.write(rec)
+        return rec
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class StdoutSink:
+
+    # summary_every: also print the rates and the share of each phase every N games (with timing)
+    def __init__(self, summary_every=100):
+        self.summary_every = summary_every
+
+    def write(self, rec):
+        print('Game: ', rec['game'], ' Score: ', rec['score'], ' Record: ', rec['record'])
+        if self.summary_every and rec['game'] % self.summary_every == 0:
+            phases = {k[5:]: v for k, v in rec.items() if k.startswith('time_')}
+            if phases:
+                total = sum(phases.values())
+                shares = '  '.join('%s %.0f%%' % (k, 100 * v / total) for k, v in phases.items())
+                print('  %.0f steps/s  %.2f games/s  %.1f updates/s | %s'
+                      % (rec['steps_per_sec'], rec['games_per_sec'], rec['updates_per_sec'], shares))
+
+    def close(self):
+        pass
+
+
+class JSONLSink:
+
+    # one JSON object per line
+    def __init__(self, file_name):
+        self.file = open(file_name, 'a')
+
+    def write(self, rec):
+        self.file.write(json.dumps(rec) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class CSVSink:
+
+    # the columns are the keys of the first record
+    def __init__(self, file_name):
+        self.file = open(file_name, 'w', newline='')
+        self.writer = None
+
+    def write(self, rec):
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, fieldnames=list(rec), extrasaction='ignore')
+            self.writer.writeheader()
+        self.writer.writerow(rec)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class HTTPSink:
+
+    '''
+    Serves the metrics on http://host:port/ from a background thread:
+    / or /latest -> the last record, /history -> all records (up to max_history)
+    '''
+
+    def __init__(self, port=8000, host='127.0.0.1', max_history=10_000):
+        self.latest = {}
+        self.history = []
+        self.max_history = max_history
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path in ('/', '/latest'):
+                    body = sink.latest
+                elif self.path == '/history':
+                    body = sink.history
+                else:
+                    self.send_error(404)
+                    return
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass # no log line per request
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def write(self, rec):
+        self.latest = rec
+        self.history.append(rec)
+        if len(self.history) > self.max_history:
+            del self.history[0]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,82 @@
+import os
+import torch
+import torch.nn as nn
+import torch.optim as optim
+import torch.nn.functional as F
+import numpy as np
+
+# the model: Linear_QNet (DQN)
+# feed forward network, input = the 11 states, 1 hidden layer, output = 3 Q values [straight, right, left]
+class Linear_QNet(nn.Module):
+
+    def __init__(self, input_size, hidden_size, output_size):
+        super().__init__()
+        self.linear1 = nn.Linear(input_size, hidden_size)
+        self.linear2 = nn.Linear(hidden_size, output_size)
+
+    def forward(self, x):
+        x = F.relu(self.linear1(x)) # activation function
+        return self.linear2(x) # raw Q values, no activation needed
+
+    # model.predict(state) -> Q values, the action is the argmax
+    def predict(self, state):
+        return self(state)
+
+    def save(self, file_name='model.pth'):
+        model_folder_path = './model'
+        if not os.path.exists(model_folder_path):
+            os.makedirs(model_folder_path)
+        file_name = os.path.join(model_folder_path, file_name)
+        torch.save(self.state_dict(), file_name)
+
+
+# the trainer: one optimization step with the Bellman equation
+class QTrainer:
+
+    def __init__(self, model, lr, gamma):
+        self.lr = lr
+        self.gamma = gamma
+        self.model = model
+        self.optimizer = optim.Adam(model.parameters(), lr=self.lr)
+
+    def train_step(self, state, action, reward, next_state, done, weights=None):
+        # works for 1 transition (train_short_memory) or a batch (train_long_memory),
+        # numpy arrays are used without a copy (torch.as_tensor)
+        state = torch.as_tensor(np.asarray(state), dtype=torch.float)
+        next_state = torch.as_tensor(np.asarray(next_state), dtype=torch.float)
+        reward = torch.as_tensor(np.asarray(reward), dtype=torch.float)
+        done = torch.as_tensor(np.asarray(done), dtype=torch.bool)
+        action = np.asarray(action)
+        if state.dim() == 1:
+            # only 1 transition: make it a batch of 1, shape (1, x)
+            state = state.unsqueeze(0)
+            next_state = next_state.unsqueeze(0)
+            reward = reward.reshape(1)
+            done = done.reshape(1)
+            action = action.reshape(1, -1) if action.size > 1 else action.reshape(1)
+        if action.ndim == 2:
+            action = action.argmax(axis=1) # one-hot [straight, right, left] -> index
+        action = torch.as_tensor(action, dtype=torch.long)
+
+        # 1: predicted Q values with current state
+        pred = self.model(state)
+        q = pred.gather(1, action.unsqueeze(1)).squeeze(1) # Q value of the action that was taken
+
+        # 2: Q_new = r + gamma * max(next_predicted Q value) -> only do this if not done
+        with torch.no_grad():
+            q_next = self.model(next_state).max(dim=1).values
+        q_new = reward + self.gamma * q_next * (~done)
+
+        # loss = (Q_new - Q)^2, weighted per transition for prioritized replay (importance sampling)
+        td_error = q_new - q
+        if weights is None:
+            loss = (td_error ** 2).mean()
+        else:
+            loss = (torch.as_tensor(np.asarray(weights), dtype=torch.float) * td_error ** 2).mean()
+
+        self.optimizer.zero_grad()
+        loss.backward()
+        self.optimizer.step()
+
+        # the TD errors are the new priorities for prioritized replay
+        return td_error.detach().abs().numpy()
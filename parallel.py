@@ -0,0 +1,185 @@
+import os
+import copy
+import queue
+import random
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from game import SnakeGameAI
+from agent import Agent, game_state
+from metrics import Metrics
+from inference import NumpyQNet
+
+'''
+Parallel training: several actor processes + 1 central learner.
+
+* every actor plays its own headless SnakeGameAI with a local copy of the model (only the
+  weights, as a NumpyQNet: no replay memory, no optimizer), and sends its transitions in chunks
+  (numpy arrays) through a queue
+* the learner (this process) owns the replay memory and the optimizer: it takes every chunk
+  waiting in the queue at once, trains as many mini-batches as the replay ratio asks for
+  (transitions trained per collected transition, not one mini-batch per chunk), and publishes
+  the new weights to a model in shared memory every publish_every mini-batches
+* the actors copy the shared weights every sync_every steps (if they changed)
+* the learner stops with an error when an actor process dies, instead of waiting for it
+
+Per-step online training (train_short_memory) is not done here, the learner
+only trains on mini-batches from the replay memory.
+
+The learner is one process, the replay ratio decides how many actors it keeps up with.
+Measured on one core: a mini-batch of 1000 takes ~5.1 ms (~5 us per trained transition),
+an actor step ~23 us (~44,000 steps/s per actor), putting a chunk into the memory and publishing
+cost ~0.1 ms each. So a ratio r keeps up with about 23 / (5 r + 0.4) actors: ~13 for the
+default 0.25, ~4 for 1, and only ~1 for the ~4 of the old one-mini-batch-per-chunk schedule.
+Above that the queue fills and the actors wait. The throughput on a many-core machine has not
+been measured.
+'''
+
+REPLAY_RATIO = 0.25 # transitions trained per collected transition
+PUBLISH_EVERY = 10 # mini-batches between two weight publishes
+
+
+# one actor process:
+# state_size and rays like the learner's Agent, the epsilon schedule of the Agent:
+# epsilon = epsilon_start - epsilon_decay * (games of all actors), a random move when randint(0,200) < epsilon
+def _actor(shared_model, version, n_games, lock, transitions, stop, chunk_size, sync_every,
+           state_size, rays, epsilon_start, epsilon_decay):
+    torch.set_num_threads(1) # 1 core per actor
+    transitions.cancel_join_thread() # don't hang on exit if the learner stopped reading
+    game = SnakeGameAI(headless=True, rays=rays)
+    net = None # the local copy of the weights, for inference only
+    local_version = -1
+    step = 0
+
+    while not stop.is_set():
+        # fresh arrays for every chunk, the queue sends them in the background
+        states = np.empty((chunk_size, state_size), dtype=np.float32)
+        actions = np.empty(chunk_size, dtype=np.int64)
+        rewards = np.empty(chunk_size, dtype=np.float32)
+        next_states = np.empty((chunk_size, state_size), dtype=np.float32)
+        dones = np.empty(chunk_size, dtype=np.bool_)
+        scores = [] # scores of the games finished in this chunk
+
+        for i in range(chunk_size):
+            # get the latest weights of the learner
+            if step % sync_every == 0 and version.value != local_version:
+                with lock:
+                    net = NumpyQNet.from_model(shared_model)
+                    local_version = version.value
+            epsilon = epsilon_start - epsilon_decay * n_games.value # the schedule follows all games played
+            step += 1
+
+            state_old = game_state(game, rays)
+            if random.randint(0,200) < epsilon:
+                final_move = random.randint(0, 2)
+            else:
+                final_move = net.action(state_old)
+            reward, done, score = game.play_step(final_move)
+            state_new = game_state(game, rays)
+
+            states[i] = state_old
+            actions[i] = final_move
+            rewards[i] = reward
+            next_states[i] = state_new
+            dones[i] = done
+            if done:
+                game.reset()
+                scores.append(score)
+
+        # send the chunk, wait if the learner is behind (but stop when asked to)
+        while not stop.is_set():
+            try:
+                transitions.put((states, actions, rewards, next_states, dones, scores), timeout=0.1)
+                break
+            except queue.Full:
+                pass
+
+
+# n_actors=None uses all cores but one (for the learner),
+# max_games=None runs forever like train(),
+# metrics: a metrics.Metrics that gets a record of every finished game, default = print every game like train(),
+# rays=True: the ray features in the state (see Agent),
+# replay_ratio: transitions trained per collected transition (Agent.train_replay), warmup: no training before
+# the memory holds that many, publish_every: new weights for the actors after this many mini-batches,
+# hyperparams: lr, gamma, batch_size, max_memory, epsilon_start, epsilon_decay for the learner's Agent (and the actors' epsilon)
+def train_parallel(n_actors=None, chunk_size=256, sync_every=1000, prioritized=False, max_games=None, metrics=None,
+                   rays=False, replay_ratio=REPLAY_RATIO, warmup=0, publish_every=PUBLISH_EVERY, **hyperparams):
+    if n_actors is None:
+        n_actors = max(1, (os.cpu_count() or 2) - 1)
+    ctx = mp.get_context('spawn')
+
+    record = 0 # best score, starts with 0
+    # the learner: replay memory + optimizer
+    agent = Agent(prioritized=prioritized, rays=rays, replay_ratio=replay_ratio, warmup=warmup, **hyperparams)
+    if metrics is None:
+        metrics = Metrics()
+    agent.metrics = metrics
+
+    # the weights the actors copy from, in shared memory
+    shared_model = copy.deepcopy(agent.model) # the same sizes as the learner's model
+    shared_model.share_memory()
+    version = ctx.Value('i', 0) # incremented whenever new weights are published
+    n_games = ctx.Value('i', 0)
+    lock = ctx.Lock()
+    transitions = ctx.Queue(maxsize=4 * n_actors)
+    stop = ctx.Event()
+
+    actors = [ctx.Process(target=_actor, daemon=True,
+                          args=(shared_model, version, n_games, lock, transitions, stop, chunk_size, sync_every,
+                                agent.state_size, rays, agent.epsilon_start, agent.epsilon_decay))
+              for _ in range(n_actors)]
+    for p in actors:
+        p.start()
+
+    unpublished = 0 # mini-batches since the last publish
+    try:
+        while max_games is None or agent.n_games < max_games:
+            # every chunk that is waiting, at least one (an actor that died would never send one)
+            try:
+                chunks = [transitions.get(timeout=1.0)]
+            except queue.Empty:
+                chunks = []
+            while True:
+                try:
+                    chunks.append(transitions.get_nowait())
+                except queue.Empty:
+                    break
+            for i, p in enumerate(actors):
+                if not p.is_alive():
+                    raise RuntimeError('actor %d stopped (exit code %s)' % (i, p.exitcode))
+
+            new = 0
+            for states, actions, rewards, next_states, dones, scores in chunks:
+                agent.memory.extend(states, actions, rewards, next_states, dones)
+                new += len(actions)
+                for score in scores:
+                    agent.n_games += 1
+                    if score > record:
+                        record = score
+                    metrics.log_game(agent.n_games, score, record, agent.n_steps + new, agent.n_updates)
+            agent.n_steps += new # steps of all actors
+            n_games.value = agent.n_games
+
+            # the mini-batches of the replay ratio, not a fixed number per chunk
+            if len(agent.memory) >= agent.warmup:
+                unpublished += agent.train_replay(new)
+
+            # publish the new weights
+            if unpublished >= publish_every:
+                with lock:
+                    shared_model.load_state_dict(agent.model.state_dict())
+                    version.value += 1
+                unpublished = 0
+    finally:
+        stop.set()
+        for p in actors:
+            p.join(timeout=1)
+            if p.is_alive():
+                p.terminate()
+        metrics.close()
+
+    return agent
+
+
+if __name__ == '__main__':
+    train_parallel()
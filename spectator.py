@@ -0,0 +1,83 @@
+import time
+import queue
+import multiprocessing as mp
+import pygame
+from game import SnakeGameAI
+
+'''
+Spectator mode: watch a game live while it runs at full speed.
+
+* the simulation calls spectator.publish(game) after every step (SnakeGameAI, or VectorSnakeEnv -> game 0);
+  it only takes a snapshot (snake cells, food, score) when the spectator is due for a new frame,
+  at most fps times per second, and sends it without waiting
+* a separate process draws the newest snapshot with the normal pygame drawing at a fixed frame rate;
+  older snapshots still waiting are skipped, and if the renderer is behind the new one is dropped
+* the game itself stays headless: no window, no clock.tick(SPEED) in the training loop
+
+    spectator = Spectator(fps=30)
+    ...
+    spectator.publish(game)
+    ...
+    spectator.close()
+
+Closing the window only stops the spectator, the training goes on.
+'''
+
+
+# the renderer process:
+def _render(frames, stop, w, h, fps):
+    game = SnakeGameAI(w, h) # a window, only used for drawing
+    pygame.display.set_caption('Snake (spectator)')
+    clock = pygame.time.Clock()
+
+    while not stop.is_set():
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                return
+
+        # the newest snapshot, skip the stale ones
+        snapshot = None
+        try:
+            while True:
+                snapshot = frames.get_nowait()
+        except queue.Empty:
+            pass
+
+        if snapshot is not None:
+            game.load_snapshot(snapshot)
+            game._draw_all()
+        clock.tick(fps)
+    pygame.quit()
+
+
+class Spectator:
+
+    def __init__(self, w=640, h=480, fps=30):
+        self.interval = 1 / fps
+        self._next = 0.0 # time of the next snapshot
+        ctx = mp.get_context('spawn')
+        self.frames = ctx.Queue(maxsize=2)
+        self.frames.cancel_join_thread() # never wait for frames nobody will draw
+        self.stop = ctx.Event()
+        self.process = ctx.Process(target=_render, args=(self.frames, self.stop, w, h, fps), daemon=True)
+        self.process.start()
+
+    def publish(self, game):
+        # cheap when no frame is due: one clock read
+        now = time.perf_counter()
+        if now < self._next:
+            return
+        self._next = now + self.interval
+        if not self.process.is_alive(): # the window was closed
+            return
+        try:
+            self.frames.put_nowait(game.snapshot())
+        except queue.Full:
+            pass # the renderer is behind: drop this frame
+
+    def close(self):
+        self.stop.set()
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
@@ -0,0 +1,218 @@
+import os
+import csv
+import json
+import math
+import time
+import random
+import argparse
+import tempfile
+import itertools
+import contextlib
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import torch
+from agent import train
+from metrics import Metrics
+
+'''
+Hyperparameter sweep: many headless train() runs (trials) at once, one per worker process.
+
+* search space: a dict parameter -> values. grid() takes every combination of lists,
+  random_search() draws n trials: a list is a choice, uniform(lo, hi) / loguniform(lo, hi) a range
+* any keyword of train() can be swept (lr, gamma, batch_size, max_memory, epsilon_start,
+  epsilon_decay, train_every, prioritized, ...)
+* the pool has one worker per core (threads_per_worker torch threads each, default 1), torch
+  threads are pinned when a worker starts, so the trials don't fight over the cores
+* a trial stops early when the rolling mean score is hopeless (EarlyStop), and after max_games anyway
+* the results table: one row per trial (params, games, mean and best rolling mean score, record,
+  stopped early, seconds) in a CSV file, best trial first, also printed at the end;
+  a trial that fails gets a row with its error, the others go on
+
+    python sweep.py                                   # grid over the default space
+    python sweep.py --random 20 --games 300           # 20 random trials from the default space
+    python sweep.py --space '{"lr": [0.001, 0.0005], "gamma": [0.9, 0.95]}' --out lr_gamma.csv
+'''
+
+# the default space: the Agent hyperparameters around the defaults of agent.py
+DEFAULT_SPACE = {
+    'lr': [0.001, 0.0005],
+    'gamma': [0.9, 0.95],
+    'batch_size': [500, 1000],
+    'epsilon_start': [80, 160],
+}
+
+
+# ranges for random_search: functions rng -> value
+def uniform(lo, hi):
+    return lambda rng: rng.uniform(lo, hi)
+
+
+def loguniform(lo, hi):
+    return lambda rng: math.exp(rng.uniform(math.log(lo), math.log(hi)))
+
+
+def grid(space):
+    # every combination of the values, in order
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_search(space, n, seed=None):
+    # n trials, every parameter drawn on its own
+    rng = random.Random(seed)
+    return [{name: values(rng) if callable(values) else rng.choice(values) for name, values in space.items()}
+            for _ in range(n)]
+
+
+class EarlyStop:
+
+    # stops a run whose mean score over the last `window` games is below min_mean after min_games games,
+    # or (patience) has not beaten its best rolling mean for patience games
+    def __init__(self, window=50, min_games=150, min_mean=1.0, patience=None):
+        self.window = window
+        self.min_games = min_games
+        self.min_mean = min_mean
+        self.patience = patience
+        self.scores = deque(maxlen=window)
+        self.total = 0
+        self.n_games = 0
+        self.record = 0
+        self.best_mean = float('-inf')
+        self.best_game = 0
+        self.stopped = False
+
+    @property
+    def mean(self):
+        return self.total / len(self.scores) if self.scores else 0.0
+
+    def __call__(self, score):
+        # train() calls this after every game, True ends the run
+        if len(self.scores) == self.window:
+            self.total -= self.scores[0]
+        self.scores.append(score)
+        self.total += score
+        self.n_games += 1
+        self.record = max(self.record, score)
+        if len(self.scores) < self.window:
+            return False
+        if self.mean > self.best_mean:
+            self.best_mean = self.mean
+            self.best_game = self.n_games
+        if self.n_games >= self.min_games:
+            if self.mean < self.min_mean:
+                self.stopped = True
+            elif self.patience is not None and self.n_games - self.best_game >= self.patience:
+                self.stopped = True
+        return self.stopped
+
+
+# the worker processes:
+def _init_worker(threads):
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(threads)
+    except RuntimeError:
+        pass # only possible before the first parallel work
+
+
+def _run_trial(trial, params, max_games, early_stop, seed):
+    random.seed(seed)
+    torch.manual_seed(seed)
+    stopper = EarlyStop(**early_stop)
+    start = time.perf_counter()
+    # in a scratch directory: train() saves model/model.pth on every record
+    with tempfile.TemporaryDirectory() as tmp, contextlib.chdir(tmp):
+        agent = train(headless=True, max_games=max_games, metrics=Metrics(sinks=[]), seed=seed,
+                      early_stop=stopper, **params)
+    return {
+        'trial': trial,
+        **params,
+        'games': agent.n_games,
+        'steps': agent.n_steps,
+        'mean_score': round(stopper.mean, 3),
+        'best_mean_score': round(max(stopper.best_mean, stopper.mean), 3),
+        'record': stopper.record,
+        'stopped_early': stopper.stopped,
+        'seconds': round(time.perf_counter() - start, 1),
+    }
+
+
+def run_sweep(trials, max_games=300, workers=None, threads_per_worker=1, early_stop=None, seed=0, out='sweep.csv'):
+    # trials: a list of param dicts (grid() / random_search()), returns the result rows, best first
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 1) // threads_per_worker)
+    early_stop = {} if early_stop is None else early_stop
+    results = []
+    ctx = mp.get_context('spawn') # fresh interpreters: no copied torch thread pools
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                             initargs=(threads_per_worker,)) as pool:
+        futures = {pool.submit(_run_trial, i, params, max_games, early_stop, seed + i): (i, params)
+                   for i, params in enumerate(trials)}
+        for future in as_completed(futures):
+            try:
+                row = future.result()
+            except Exception as e: # e.g. a ValueError for params that don't go together
+                i, params = futures[future]
+                row = {'trial': i, **params, 'error': '%s: %s' % (type(e).__name__, e)}
+                print('Trial: ', i, ' failed: ', row['error'])
+            else:
+                print('Trial: ', row['trial'], ' Games: ', row['games'], ' Mean score: ', row['mean_score'],
+                      ' Record: ', row['record'], ' (stopped early)' if row['stopped_early'] else '')
+            results.append(row)
+            if out is not None:
+                write_results(results, out) # so far, an interrupted sweep keeps its finished trials
+    # failed trials last
+    results.sort(key=lambda row: row.get('best_mean_score', float('-inf')), reverse=True)
+    if out is not None:
+        write_results(results, out)
+    return results
+
+
+def _columns(results):
+    # the union of the keys of all rows (trials may sweep different params)
+    columns = []
+    for row in results:
+        columns += [key for key in row if key not in columns]
+    return columns
+
+
+def write_results(results, file_name):
+    # the table as CSV
+    with open(file_name, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=_columns(results))
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def print_results(results):
+    if not results:
+        return
+    columns = _columns(results)
+    widths = [max(len(str(c)), *(len(str(row.get(c, ''))) for row in results)) for c in columns]
+    print('  '.join(str(c).ljust(w) for c, w in zip(columns, widths)))
+    for row in results:
+        print('  '.join(str(row.get(c, '')).ljust(w) for c, w in zip(columns, widths)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Hyperparameter sweep over headless train() runs')
+    parser.add_argument('--space', type=json.loads, help='search space as JSON: {"param": [values], ...}')
+    parser.add_argument('--random', type=int, metavar='N', help='N random trials instead of the full grid')
+    parser.add_argument('--games', type=int, default=300, help='games per trial at most')
+    parser.add_argument('--workers', type=int, help='worker processes (default: cores / threads)')
+    parser.add_argument('--threads', type=int, default=1, help='torch threads per worker')
+    parser.add_argument('--window', type=int, default=50, help='games in the rolling mean score')
+    parser.add_argument('--min-games', type=int, default=150, help='no early stop before this many games')
+    parser.add_argument('--min-mean', type=float, default=1.0, help='stop trials with a lower rolling mean')
+    parser.add_argument('--patience', type=int, help='stop trials without a better rolling mean for this many games')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='sweep.csv')
+    args = parser.parse_args()
+
+    space = args.space if args.space is not None else DEFAULT_SPACE
+    trials = random_search(space, args.random, args.seed) if args.random else grid(space)
+    early_stop = dict(window=args.window, min_games=args.min_games, min_mean=args.min_mean, patience=args.patience)
+    results = run_sweep(trials, max_games=args.games, workers=args.workers, threads_per_worker=args.threads,
+                        early_stop=early_stop, seed=args.seed, out=args.out)
+    print_results(results)
@@ -0,0 +1,142 @@
+import os
+import argparse
+import numpy as np
+from game import VectorSnakeEnv, encode_states
+
+'''
+Tabular Q-learning: the 11 binary features of get_state are at most 2^11 = 2048 states,
+so the Q values fit in a dense numpy table Q[2048, 3] (state index, action) - no network needed.
+
+* state_index: the 11 bits -> one integer (feature i = bit i, the same order as CompactReplayMemory)
+* update: batched TD update, from a replay batch (memory.sample) or from one step of a VectorSnakeEnv
+* policy: the greedy action of every state, a (2048,) lookup table
+
+It doesn't import torch and trains in seconds on one core:
+a fast baseline / sanity check next to the DQN agent.
+
+    python tabular.py                   # train on 256 games at once, save model/tabular_policy.npy
+'''
+
+N_FEATURES = 11
+N_STATES = 2 ** N_FEATURES
+N_ACTIONS = 3
+_BITS = 1 << np.arange(N_FEATURES)
+
+
+def state_index(states):
+    # (n, 11) 0/1 features -> (n,) indices into the table, also a single state -> int
+    states = np.asarray(states)
+    return states.astype(np.int64) @ _BITS
+
+
+def greedy_actions(policy, states):
+    # actions (0 straight, 1 right, 2 left) of an exported policy table for a batch of states
+    return policy[state_index(states)]
+
+
+class TabularAgent:
+
+    def __init__(self, lr=0.1, gamma=0.9, epsilon_start=1.0, epsilon_end=0.01, epsilon_steps=1000, seed=None):
+        self.q = np.zeros((N_STATES, N_ACTIONS))
+        self.lr = lr
+        self.gamma = gamma
+        # epsilon goes linearly from epsilon_start to epsilon_end over epsilon_steps updates
+        self.epsilon_start = epsilon_start
+        self.epsilon_end = epsilon_end
+        self.epsilon_steps = epsilon_steps
+        self.n_updates = 0
+        self.rng = np.random.default_rng(seed)
+
+    @property
+    def epsilon(self):
+        frac = min(self.n_updates / self.epsilon_steps, 1.0) if self.epsilon_steps else 1.0
+        return self.epsilon_start + frac * (self.epsilon_end - self.epsilon_start)
+
+    def get_actions(self, states, explore=True):
+        # epsilon-greedy action indices for a batch of states
+        actions = self.q[state_index(states)].argmax(1)
+        if explore:
+            random_moves = self.rng.random(len(actions)) < self.epsilon
+            actions[random_moves] = self.rng.integers(0, N_ACTIONS, random_moves.sum())
+        return actions
+
+    def get_action(self, state):
+        # one state -> one move 0, 1, 2, like Agent.get_action
+        return int(self.get_actions(np.asarray(state)[None])[0])
+
+    def update(self, states, actions, rewards, next_states, dones):
+        # one batched TD step: Q(s, a) += lr * (r + gamma * max Q(s', .) - Q(s, a))
+        # a (s, a) pair that appears several times in the batch gets the mean of its TD errors,
+        # so the step size doesn't grow with the number of duplicates (many games share a state)
+        s = state_index(states)
+        s_next = state_index(next_states)
+        actions = np.asarray(actions)
+        if actions.ndim == 2: # one-hot rows
+            actions = actions.argmax(1)
+        target = np.asarray(rewards, dtype=np.float64) + self.gamma * self.q[s_next].max(1) * ~np.asarray(dones, dtype=bool)
+        td = target - self.q[s, actions]
+
+        cells = s * N_ACTIONS + actions
+        sums = np.bincount(cells, weights=td, minlength=self.q.size)
+        counts = np.bincount(cells, minlength=self.q.size)
+        seen = counts > 0
+        self.q.reshape(-1)[seen] += self.lr * sums[seen] / counts[seen]
+
+        self.n_updates += 1
+        return np.abs(td)
+
+    def policy(self):
+        # the greedy action of every state (states never visited: 0, straight)
+        return self.q.argmax(1).astype(np.uint8)
+
+    def save_policy(self, file_name='tabular_policy.npy'):
+        model_folder_path = './model'
+        if not os.path.exists(model_folder_path):
+            os.makedirs(model_folder_path)
+        np.save(os.path.join(model_folder_path, file_name), self.policy())
+
+
+def _states(env):
+    return encode_states(env.heads, env.directions, env.foods, env.occupancy)
+
+
+def train_tabular(n_envs=256, n_steps=3000, w=640, h=480, seed=None, print_every=500, **agent_kwargs):
+    # trains on n_envs games at once, one batched update per step of all games
+    agent_kwargs.setdefault('epsilon_steps', n_steps // 2)
+    agent = TabularAgent(seed=seed, **agent_kwargs)
+    env = VectorSnakeEnv(n_envs, w, h, seed=seed)
+    n_games = 0
+    record = 0
+    recent = [] # scores of the games finished since the last print
+
+    states = _states(env)
+    for step in range(1, n_steps + 1):
+        actions = agent.get_actions(states)
+        rewards, dones, scores = env.step(actions)
+        next_states = _states(env)
+        # finished games are already reset: their next state is a new game, but done ignores it
+        agent.update(states, actions, rewards, next_states, dones)
+        states = next_states
+
+        finished = scores[dones]
+        n_games += len(finished)
+        if len(finished):
+            record = max(record, int(finished.max()))
+            recent.extend(finished.tolist())
+        if print_every and step % print_every == 0:
+            mean = np.mean(recent) if recent else 0.0
+            print('Step: ', step, ' Games: ', n_games, ' Mean score: ', round(float(mean), 2), ' Record: ', record)
+            recent = []
+
+    return agent
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tabular Q-learning on the 11 state features')
+    parser.add_argument('--envs', type=int, default=256, help='games played at once')
+    parser.add_argument('--steps', type=int, default=3000, help='steps of all games')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    agent = train_tabular(n_envs=args.envs, n_steps=args.steps, seed=args.seed)
+    agent.save_policy()
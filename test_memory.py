@@ -0,0 +1,66 @@
+import numpy as np
+from memory import PrioritizedReplayMemory
+
+'''
+Resuming a memory-mapped prioritized memory from a checkpoint: the files keep changing after
+the checkpoint (training goes on), load_state_dict must give a sum-tree that matches the counters.
+
+    python -m pytest test_memory.py
+'''
+
+
+def _fill(memory, n, rng):
+    memory.extend(rng.integers(0, 2, (n, 11)), rng.integers(0, 3, n), rng.choice([-10, 0, 10], n),
+                  rng.integers(0, 2, (n, 11)), rng.random(n) < 0.1)
+    idx = np.arange(memory.size)
+    memory.update_priorities(idx, rng.random(memory.size) * 10)
+
+
+def _resume(path, capacity, before, after):
+    rng = np.random.default_rng(0)
+    memory = PrioritizedReplayMemory(capacity, path=path, seed=0)
+    _fill(memory, before, rng)
+    state = memory.state_dict() # the checkpoint
+    _fill(memory, after, rng) # training goes on, the files run ahead of the checkpoint
+    memory.flush()
+    del memory
+
+    resumed = PrioritizedReplayMemory(capacity, path=path, seed=0)
+    resumed.load_state_dict(state)
+    return resumed, state
+
+
+def _check_tree(memory):
+    tree = memory.tree
+    leaves = tree.tree[tree.leaf_start:]
+    assert np.all(leaves[memory.size:] == 0)
+    assert np.isclose(tree.total, leaves[:memory.size].sum())
+    # every internal node is the sum of its children
+    nodes = np.arange(1, tree.leaf_start)
+    assert np.allclose(tree.tree[nodes], tree.tree[2 * nodes] + tree.tree[2 * nodes + 1])
+
+
+def test_resume_not_full(tmp_path):
+    memory, state = _resume(str(tmp_path), 1000, 100, 50)
+    assert len(memory) == state['size'] == 100
+    _check_tree(memory)
+    # the sampled slots follow the priorities, nothing piles up on the last slot
+    idx = memory.sample(5000)[-1]
+    assert idx.max() < memory.size
+    expected = memory.tree.priorities(memory.size - 1) / memory.tree.total
+    assert np.mean(idx == memory.size - 1) < expected + 0.02
+
+
+def test_resume_full(tmp_path):
+    memory, state = _resume(str(tmp_path), 64, 100, 10)
+    assert len(memory) == 64 and memory.position == state['position']
+    _check_tree(memory)
+
+
+def test_rebuild_matches_updates():
+    rng = np.random.default_rng(1)
+    memory = PrioritizedReplayMemory(100)
+    _fill(memory, 70, rng)
+    before = memory.tree.tree.copy()
+    memory.tree.rebuild()
+    assert np.allclose(memory.tree.tree, before)
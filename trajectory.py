@@ -0,0 +1,157 @@
+import os
+import struct
+import numpy as np
+from game import SnakeGameAI, encode_states, action_index
+
+'''
+Trajectory files: every finished game as its seed + the actions taken (1 byte per step),
+optionally + the rewards (1 more byte per step). A game started with reset(seed) and
+played with the same actions is always the same game, so that is enough to rebuild it.
+
+File layout (little endian), append-only:
+    file header     8s magic 'SNAKETRJ', H version, H w, H h, H flags (1 = rewards)       16 bytes
+    every episode:  Q seed, I steps, i score                                              16 bytes
+                    steps x uint8 action (0 straight, 1 right, 2 left)
+                    steps x int8 reward (with the rewards flag)
+
+An episode is written when the game ends, a crash loses at most the game being played
+(a cut-off last episode is ignored when reading). TrajectoryReader memory-maps the file:
+the action and reward streams are numpy views, nothing is copied.
+
+    recorder = TrajectoryRecorder('run.traj', game.w, game.h, rewards=True)
+    recorder.step(action, reward) ... recorder.end_episode(game.seed, score)
+
+    reader = TrajectoryReader('run.traj')
+    reader.replay(i)                    # steps of episode i: (game, action, reward, done)
+    reader.fill_memory(agent.memory)    # transitions of all episodes into a replay memory
+'''
+
+MAGIC = b'SNAKETRJ'
+VERSION = 1
+FLAG_REWARDS = 1
+_FILE_HEADER = struct.Struct('<8sHHHH')
+_EPISODE_HEADER = struct.Struct('<QIi')
+
+
+class TrajectoryRecorder:
+
+    def __init__(self, file_name, w=640, h=480, rewards=False):
+        self.flags = FLAG_REWARDS if rewards else 0
+        header = _FILE_HEADER.pack(MAGIC, VERSION, w, h, self.flags)
+        if os.path.exists(file_name) and os.path.getsize(file_name) > 0:
+            # append to an existing file, it must have the same settings
+            with open(file_name, 'rb') as f:
+                if f.read(_FILE_HEADER.size) != header:
+                    raise ValueError('%s was recorded with other settings (board size or rewards)' % file_name)
+            self.file = open(file_name, 'ab')
+        else:
+            self.file = open(file_name, 'wb')
+            self.file.write(header)
+        self.actions = bytearray()
+        self.rewards = bytearray()
+
+    def step(self, action, reward=0):
+        # action: index or one-hot
+        self.actions.append(action_index(action))
+        if self.flags & FLAG_REWARDS:
+            self.rewards.append(reward & 0xff) # int8
+
+    def end_episode(self, seed, score):
+        self.file.write(_EPISODE_HEADER.pack(seed, len(self.actions), score))
+        self.file.write(self.actions)
+        if self.flags & FLAG_REWARDS:
+            self.file.write(self.rewards)
+        self.file.flush()
+        self.actions = bytearray()
+        self.rewards = bytearray()
+
+    def close(self):
+        # the game being played (not ended yet) is not written
+        self.file.close()
+
+
+class TrajectoryReader:
+
+    def __init__(self, file_name):
+        self.data = np.memmap(file_name, dtype=np.uint8, mode='r')
+        magic, version, self.w, self.h, flags = _FILE_HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a trajectory file' % file_name)
+        self.has_rewards = bool(flags & FLAG_REWARDS)
+
+        # index of the episodes: offset of the actions, seed, steps, score
+        self.offsets = []
+        self.seeds = []
+        self.steps = []
+        self.scores = []
+        per_step = 2 if self.has_rewards else 1
+        pos = _FILE_HEADER.size
+        while pos + _EPISODE_HEADER.size <= len(self.data):
+            seed, steps, score = _EPISODE_HEADER.unpack_from(self.data, pos)
+            end = pos + _EPISODE_HEADER.size + per_step * steps
+            if end > len(self.data):
+                break # cut off while writing
+            self.offsets.append(pos + _EPISODE_HEADER.size)
+            self.seeds.append(seed)
+            self.steps.append(steps)
+            self.scores.append(score)
+            pos = end
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def episode(self, i):
+        # seed, actions (uint8 view), rewards (int8 view or None), score of episode i
+        start, steps = self.offsets[i], self.steps[i]
+        actions = self.data[start:start + steps]
+        rewards = self.data[start + steps:start + 2 * steps].view(np.int8) if self.has_rewards else None
+        return self.seeds[i], actions, rewards, self.scores[i]
+
+    def replay(self, i, game=None):
+        # plays episode i again, yields (game, action, reward, done) after every step;
+        # pass a game with a display to watch it
+        seed, actions, rewards, score = self.episode(i)
+        if game is None:
+            game = SnakeGameAI(self.w, self.h, headless=True)
+        game.reset(seed)
+        for action in actions.tolist():
+            reward, done, _ = game.play_step(action)
+            yield game, action, reward, done
+
+    def transitions(self, i):
+        # (states, actions, rewards, next_states, dones) of episode i as numpy arrays,
+        # the states are the 11 features of Agent.get_state
+        seed, actions, recorded, score = self.episode(i)
+        steps = len(actions)
+        game = SnakeGameAI(self.w, self.h, headless=True)
+        game.reset(seed)
+
+        # heads, directions, foods and occupancy of every position, encoded in one go at the end
+        heads = np.empty((steps + 1, 2), dtype=np.int64)
+        directions = np.empty(steps + 1, dtype=np.int64)
+        foods = np.empty((steps + 1, 2), dtype=np.int64)
+        occupancy = np.empty((steps + 1, game.rows, game.cols), dtype=np.uint8)
+        rewards = np.empty(steps, dtype=np.float32)
+        dones = np.zeros(steps, dtype=np.bool_)
+
+        def keep(t):
+            heads[t] = game.cell_xy(game.head_cell)
+            directions[t] = game.dir
+            foods[t] = game.cell_xy(game.food_cell) if game.food_cell >= 0 else (-1, -1)
+            occupancy[t] = game.occupancy
+
+        keep(0)
+        for t, action in enumerate(actions.tolist()):
+            rewards[t], dones[t], _ = game.play_step(action)
+            keep(t + 1)
+
+        if recorded is not None and not np.array_equal(recorded, rewards):
+            raise ValueError('episode %d does not replay to its recorded rewards' % i)
+        states = encode_states(heads, directions, foods, occupancy)
+        return states[:-1], actions.astype(np.int64), rewards, states[1:], dones
+
+    def fill_memory(self, memory, episodes=None):
+        # put the transitions of the episodes (default all) into a replay memory
+        for i in range(len(self)) if episodes is None else episodes:
+            memory.extend(*self.transitions(i))
+        return memory